@@ -2,11 +2,14 @@ import time
 import sys
 import signal
 import socket
-import numpy 
+import argparse
+import numpy as np
+from poets import protocol
+from poets import csvreader
+from poets.runstore import RunStore, wire_records
 
 # Socket Configurations
 ############################################################################
-API_DELIMINATOR = "-"
 PORT = 5064 
 # SERVER = socket.getaddrinfo(socket.gethostname(), PORT) # The Server address is automatically found by checking the current computer's IP address
 ADDR = ("::1", PORT)    ## Local address for now
@@ -23,28 +26,146 @@ def signal_handler(signal_in, frame):
     sys.exit(0)
   
 
+# Replay Configurations
+############################################################################
+MIN_SPEED, MAX_SPEED = 0.1, 100.0
+MIN_SLEEP = 0.001       ## datagrams due sooner than this are sent straight away, sleeps that short overshoot
+LOOP_GAP = 2            ## seconds between two passes of a looped replay, so the visualiser sees separate runs
+
+
+def openSlices(args, start):
+    ''' Time slices of the chosen source from cIDX start on, as RUN_RECORD arrays that keep the recorded time '''
+    if args.store:
+        ## The store is memory-mapped, each time instance is read from disk only when it is sent
+        return (rows for _, rows in RunStore(args.store).seconds(start))
+    if args.threads:
+        ## The per-thread files are merged on cIDX as they are sent, a few files open at a time
+        slices = csvreader.merge_thread_files(args.threads)
+    else:
+        ## The CSV is parsed a block at a time while sending, each time instance is sent as soon as it is complete
+        slices = csvreader.stream_slices(args.csv)
+    return (rows for rows in slices if rows['cidx'][0] >= start)
+
+
+def withNext(slices):
+    ''' Pairs every slice with the one following it, None for the last '''
+    previous = None
+    for rows in slices:
+        if previous is not None:
+            yield previous, rows
+        previous = rows
+    if previous is not None:
+        yield previous, None
+
+
+def sliceSchedule(rows, following, pacing):
+    ''' Rows in sending order and the recorded time, relative to the start of the slice, at which every
+        record is due. "even" spreads the slice over the interval until the next slice starts, "recorded"
+        follows the Time column of every record '''
+    start = rows['time'].min()
+    if pacing == "recorded":
+        order = np.argsort(rows['time'], kind="stable")
+        return rows[order], rows['time'][order] - start
+    if following is not None and following['time'].min() > start:
+        interval = following['time'].min() - start
+    elif following is not None:     ## no usable time, one second per cIDX like the hardware
+        interval = float(following['cidx'][0] - rows['cidx'][0])
+    else:
+        interval = max(rows['time'].max() - start, 1.0)
+    return rows, np.arange(len(rows)) * (interval / len(rows))
+
+
+def replay(slices, wire_format, speed, pacing):
+    ''' Sends the slices paced at speed times the recorded rate, returns (samples, datagrams, bytes, seconds) '''
+    step = protocol.records_per_datagram() if wire_format == "binary" else 1
+    samples = datagrams = sent_bytes = 0
+    begin = time.perf_counter()
+    slice_start = begin         ## wall clock time at which the current slice is due
+    for rows, following in withNext(slices):
+        rows, due = sliceSchedule(rows, following, pacing)
+        records = wire_records(rows)
+        first_sent = time.perf_counter()
+        for first in range(0, len(records), step):
+            wait = slice_start + due[first] / speed - time.perf_counter()
+            if wait > MIN_SLEEP:
+                time.sleep(wait)
+            if wire_format == "binary":
+                message = protocol.encode_binary(records[first:first + step])    ## as many records per datagram as fit in the MTU
+            else:
+                message = protocol.encode_text(records[first])
+            Sock.sendto(message, ADDR)
+            datagrams += 1
+            sent_bytes += len(message)
+        samples += len(records)
+        now = time.perf_counter()
+        lag = now - (slice_start + due[-1] / speed)        ## how far behind schedule the last datagram went out
+        print("cIDX " + str(rows['cidx'][0]) + ": " + str(len(records)) + " samples in " + str(-(-len(records) // step)) +
+              " datagrams over " + str(round(now - first_sent, 3)) + " s, " + str(round(max(lag, 0) * 1000, 1)) + " ms behind")
+        if following is not None:
+            gap = following['time'].min() - rows['time'].min()
+            if gap <= 0:
+                gap = float(following['cidx'][0] - rows['cidx'][0])
+            slice_start += gap / speed      ## the next slice starts at its own recorded time
+    return samples, datagrams, sent_bytes, time.perf_counter() - begin
+
+
 def main():
-    current = 0  
+    parser = argparse.ArgumentParser(description="Replays an instrumentation CSV to the visualiser")
+    parser.add_argument("--format", choices=["auto", "binary", "text"], default="auto",
+                        help="wire format of the packets, auto asks the visualiser which one it understands")
+    parser.add_argument("--csv", default="./new_data/instrumentation.csv",
+                        help="instrumentation CSV to replay")
+    parser.add_argument("--threads", default=None,
+                        help="replay a directory of instrumentation_thread_<id>.csv files instead of the CSV")
+    parser.add_argument("--store", default=None,
+                        help="replay a run store written by poets.runstore instead of the CSV")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="replay speed relative to the recording, from " + str(MIN_SPEED) + " to " + str(MAX_SPEED))
+    parser.add_argument("--pacing", choices=["even", "recorded"], default="even",
+                        help="spread each time instance evenly until the next one, or follow the Time of every record")
+    parser.add_argument("--start", type=int, default=0, help="first cIDX sent")
+    parser.add_argument("--loop", type=int, default=1, help="number of passes over the run, 0 loops until interrupted")
+    args = parser.parse_args()
+    if not MIN_SPEED <= args.speed <= MAX_SPEED:
+        parser.error("--speed must be between " + str(MIN_SPEED) + " and " + str(MAX_SPEED))
+
     signal.signal(signal.SIGINT, signal_handler)
-    fName = './new_data/instrumentation.csv'
-    ## Loading the entire document so that data can be sent without interruptions at fixed intervals
-    try:
-        file_obj = open(fName, "rb")
-        data = numpy.loadtxt(file_obj, delimiter=",",
-                            skiprows=1, max_rows= None, usecols=(0, 1, 12, 13, 14, 15, 16, 18))
-    except Exception as e:
-        print("Couldn't open file because " + str(e))
-    
-    for s in (data):
-        if(s[1]>current):   ## s[1] represents the time instance for the data packet, before a new time instance is sent, 1 second must be awaited
-            current = s[1]
-            time.sleep(1)
-        message_str = str(s[0]) + API_DELIMINATOR + str(s[1]) + API_DELIMINATOR + str(s[2]) + API_DELIMINATOR + str(s[3]) + API_DELIMINATOR + str(s[4]) + API_DELIMINATOR + str(s[5]) + API_DELIMINATOR + str(s[6]) + API_DELIMINATOR + str(s[7])
-        Sock.sendto(message_str.encode('utf-8'), ADDR)
-        print(message_str)
-
-    time.sleep(2)
-    print("DISCONNECTING")
+    if args.store:
+        try:
+            RunStore(args.store)
+        except Exception as e:
+            print("Couldn't open store because " + str(e))
+            return
+    elif args.threads:
+        if not csvreader.thread_files(args.threads):
+            print("Couldn't find any " + csvreader.THREAD_FILE_PATTERN + " file in " + args.threads)
+            return
+    else:
+        fName = args.csv
+        try:
+            open(fName, "rb").close()
+        except Exception as e:
+            print("Couldn't open file because " + str(e))
+            return
+
+    wire_format = args.format
+    if wire_format == "auto":
+        wire_format = protocol.negotiate(Sock, ADDR)
+    print("Sending in " + wire_format + " format at " + str(args.speed) + "x from cIDX " + str(args.start))
+
+    passes = 0
+    while args.loop == 0 or passes < args.loop:
+        if passes:
+            time.sleep(LOOP_GAP)
+        samples, datagrams, sent_bytes, seconds = replay(openSlices(args, args.start), wire_format, args.speed, args.pacing)
+        passes += 1
+        seconds = max(seconds, 1e-9)
+        print("Pass " + str(passes) + ": " + str(samples) + " samples in " + str(round(seconds, 2)) + " s, sustained " +
+              str(round(samples / seconds)) + " samples/s, " + str(round(datagrams / seconds)) + " datagrams/s, " +
+              str(round(sent_bytes * 8 / seconds / 1e6, 2)) + " Mbit/s")
+        time.sleep(2)
+        print("DISCONNECTING")
+        Sock.sendto(protocol.END_MSG, ADDR)     ## the run is over, the visualiser doesn't have to wait for its timeout
 
 if __name__ == '__main__':
     main()
@@ -1,17 +1,21 @@
-import sys 
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  ## repository root, for the poets package
+from poets import live
 
 def on_session_destroyed(session_context):
     # This function executes when the server closes a session.
-    sys.exit(0)
+    # Sessions unsubscribe from the shared state themselves, which keeps running for the other viewers.
+    pass
 
 def on_server_loaded(server_context):
     # This function executes when the server starts.
-    pass
+    live.shared()   ## ingest and aggregation are started once, before the first session
 
 def on_server_unloaded(server_context):
     # This function executes when the server shuts down.
-    pass
+    live.stop_shared()
 
 def on_session_created(session_context):
     # This function executes when the server creates a session.
-    pass
\ No newline at end of file
+    pass
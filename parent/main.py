@@ -3,103 +3,60 @@
     and a line graph show idle and cache values respectively. The dashboard follows a Bootstrap
     template and is shown locally.
 '''
-from multiprocessing import Queue
-import threading
 import sys
-import socket
+import os
+import collections
 import time
-import signal
 import numpy as np
-import random
 from bokeh.models import (ColorBar, ColumnDataSource, SingleIntervalTicker,
                           LinearColorMapper, PrintfTickFormatter, HoverTool,
                           NumberFormatter, RangeTool, StringFormatter, TableColumn)
 from bokeh.plotting import figure, curdoc
+from bokeh import events
 from bokeh.models.widgets import DataTable, TableColumn
-from bokeh.models import Button, Dropdown
-from bokeh.layouts import column
+from bokeh.models import Button, Dropdown, Select, TextInput, Div
+from bokeh.layouts import column, row
 from bokeh.transform import linear_cmap
 from bokeh.palettes import Turbo256 as palette2
+from bokeh.palettes import Category20
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  ## repository root, for the poets package
+from poets import live
+from poets.ringbuffer import RingBuffer
 
-# Socket Configurations
+# Shared state, the ingest and aggregation run once for all the sessions of the server, see app_hooks.py
 ############################################################################
-API_DELIMINATOR = "-" 
-PORT = 5064
-#host = socket.gethostname()
-#SERVER = socket.getaddrinfo(host, PORT, socket.AF_INET6)    ## Automatically get local IPV6 Address 
-ADDR = ("::1", PORT)  ## local address for now
-sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM, socket.IPPROTO_IP) ## Create UDP socket
-sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, False)
-sock.bind(ADDR)
-sock.settimeout(7)
-disconnect_msg = "DISCONNECT"
+state = live.shared()
+doc = curdoc()          ## kept for the notifications of the shared state, which may come from another thread
+session_key = id(doc)
 
 
 # POETS Configurations
 ############################################################################
-refresh_rate = 900 ## Time in millisecond for updating live plots
-ThreadCount = 49152   # The actual number of threads present in a POETS box is 6144 - 49152 in total
-ThreadLevel = np.ndarray(ThreadCount, buffer=np.zeros(ThreadCount), dtype=np.uint16)
-mainQueue = Queue()
-mainQueue.put(ThreadLevel, False) ## initialise queue object so it isn't empty at start
-current_data = np.ndarray(ThreadCount, buffer=np.zeros(ThreadCount), dtype=np.uint16)
-empty = np.ndarray(ThreadCount, buffer=np.zeros(ThreadCount), dtype=np.uint16)
+refresh_rate = int(state.refresh * 1000) ## Time in millisecond between two updates of the shared state, at most one frame each
+topology = state.topology
+ThreadCount = topology.thread_count   # The actual number of threads present in a POETS box is 6144 - 49152 in total
+CoreCount = topology.counts["CORE"]
+MailboxCount = topology.counts["MAILBOX"]
+BoardCount = topology.counts["BOARD"]
+BoxCount = topology.counts["BOX"]
+mainQueue = None        ## channel of the frames published by the shared state, subscribed once the document is built
+shown_frame = None      ## number of the frame the heatmap shows, the other charts are drawn up to it
+update_scheduled = False        ## plotterUpdater is already waiting for the next tick
 
-n = 16 # number of threads in a core
-root_core = 48 
-root_mailbox = 24 
-root_board = 6 
-root_box = 2 
 
-maxRow = 0 # This is the number of time instances needed to plot the thread data
-entered = 0
-total = 0
 
-
-
-# Plot Configurations, calculating heatmap coordinates based on hierarchical view
+# Plot Configurations, heatmap coordinates of every hierarchical view come from the topology
 ############################################################################
-row_x = [x for x in range(root_core)]
-core_count_x = []
-core_count_y = []
-for i in range(root_core + 16): ## + 16 because sixteen extra rows are needed to reach 3072 mailbox count
-    core_count_x.extend(row_x)
-    column_y = [i*2 for x in range(root_core)]
-    core_count_y.extend(column_y)
-CoreCount = len(core_count_x)
-
-
-row_x = [x for x in range(root_mailbox)]
-mailbox_count_x = []
-mailbox_count_y = []
-for i in range(root_mailbox + 8): ## + 8 because eight extra rows are needed to reach 768 mailbox count
-    mailbox_count_x.extend(row_x)
-    column_y = [i * 2 for x in range(root_mailbox)]
-    mailbox_count_y.extend(column_y)
-MailboxCount = len(mailbox_count_x)
-
-
-row_x = [x for x in range(root_board)]
-board_count_x = []
-board_count_y = []
-for i in range(root_board+2):     ## + 2 because two extra rows are needed to reach 48 board count
-    board_count_x.extend(row_x)
-    column_y = [i*2 for x in range(root_board)]
-    board_count_y.extend(column_y)
-BoardCount = len(board_count_x)
-
-
-row_x = [x for x in range(root_box)]
-box_count_x = []
-box_count_y = []
-for i in range(root_box+2):     ## + 2 because two extra rows are needed to reach 8 box count
-    box_count_x.extend(row_x)
-    column_y = [i*2 for x in range(root_box)]
-    box_count_y.extend(column_y)
-BoxCount = len(box_count_x)
-
-selected_count_x = core_count_x
-selected_count_y = core_count_y
+## Tile coordinates and colour range of every hierarchy level shown by the heatmap
+heatmap_levels = {"THREAD"  : topology.tiles["THREAD"] + (1000,),
+                  "CORE"    : topology.tiles["CORE"] + (1000,),
+                  "MAILBOX" : topology.tiles["MAILBOX"] + (500,),
+                  "BOARD"   : topology.tiles["BOARD"] + (200,),
+                  "BOX"     : topology.tiles["BOX"] + (100,)}
+heatmap_view = "CORE"  # Hierarchy level shown by the heatmap
+## Levels drawn as one RGBA image coloured by the server instead of one rect per tile. THREAD always is,
+## POETS_HEATMAP=raster draws every level this way
+raster_levels = set(heatmap_levels) if os.environ.get("POETS_HEATMAP") == "raster" else {"THREAD"}
 
 #Configurations for Heatmap - Used for TX/S values
 #Extra tools available on the webpage
@@ -118,9 +75,39 @@ heatmap.toolbar.logo = None
 
 #Fixed heatmap colours, going from light green to dark red
 colours = ["#75968f", "#a5bab7", "#c9d9d3", "#e2e2e2", "#dfccce", "#ddb7b1", "#cc7878", "#933b41", "#550b1d"]
-max_colour = 1000   ## variable used to change colour range for different hierarchical views
 
-bar_map = LinearColorMapper(palette = colours, low = 0, high = 1000 )#5 to 25k
+## Colours as RGBA uint32 pixels, the byte order image_rgba expects
+colours_rgba = np.array([int(c[5:7], 16) << 16 | int(c[3:5], 16) << 8 | int(c[1:3], 16) | 0xff000000 for c in colours], dtype=np.uint32)
+
+### One persistent renderer per hierarchy level, only the selected one is visible.
+### Live updates patch the intensities of these sources instead of adding a renderer every tick
+heatmap_sources = dict()
+heatmap_renderers = dict()
+heatmap_shown = dict()     ## intensities currently held by each source, used to find the changed tiles
+heatmap_luts = dict()      ## pixel of every uint16 intensity, for the raster levels
+for level, (count_x, count_y, max_colour) in heatmap_levels.items():
+    heatmap_shown[level] = np.zeros(len(count_x), dtype=np.int64)
+    if level in raster_levels:
+        ## Tile i is pixel i of an image of grid_widths[level] columns, as linear_cmap would colour it
+        width = topology.grid_widths[level]
+        rows = -(-len(count_x) // width)
+        heatmap_luts[level] = colours_rgba[np.minimum(np.arange(1 << 16) * len(colours) // max_colour, len(colours) - 1)]
+        image = np.zeros(rows * width, dtype=np.uint32)     ## pixels past the last tile stay transparent
+        image[:len(count_x)] = heatmap_luts[level][0]
+        heatmap_sources[level] = ColumnDataSource(data={'image' : [image.reshape(rows, width)]})
+        heatmap_renderers[level] = heatmap.image_rgba(image='image', x=-0.5, y=-1, dw=width, dh=rows * 2,
+                                                      source = heatmap_sources[level], visible = (level == heatmap_view))
+        continue
+    heatmap_sources[level] = ColumnDataSource(data={'x' : count_x,
+                                                    'y' : count_y,
+                                                    'intensity' : [0] * len(count_x)})
+    mapper = linear_cmap(field_name="intensity", palette=colours, low=0, high= max_colour )
+    heatmap_renderers[level] = heatmap.rect(x='x',  y='y', width = 1, height = 2, source = heatmap_sources[level],
+                                            fill_color=mapper, line_color = "grey", visible = (level == heatmap_view))
+## The hover tool reads the rect columns, the tile under the mouse of a raster level is found by the server
+hover.renderers = [heatmap_renderers[level] for level in heatmap_levels if level not in raster_levels]
+
+bar_map = LinearColorMapper(palette = colours, low = 0, high = heatmap_levels[heatmap_view][2] )#5 to 25k
 color_bar = ColorBar(color_mapper=bar_map,
                 ticker=SingleIntervalTicker(interval = 100),
                 formatter=PrintfTickFormatter(format="%d"+" TX/s"))
@@ -129,7 +116,7 @@ heatmap.add_layout(color_bar, 'right')
 
 
 #Configurations for Live Line Chart - Used for TX
-TOOLTIPS2 = [("Core", "$index")]
+TOOLTIPS2 = [("core", "@entity")]
 hover2=HoverTool(tooltips=TOOLTIPS2)
 liveLine = figure(height = 590, width = 720, tools=[hover2, TOOLS], title = "Live Instrumentation", name = "liveLine", toolbar_location="below", y_axis_location = "right")
 liveLine.toolbar.logo = None
@@ -141,21 +128,46 @@ liveLine.xaxis.ticker = SingleIntervalTicker(interval= 1)
 liveLine.yaxis.formatter = PrintfTickFormatter(format="%d TX")
 
 step = refresh_rate/1000 # Step for X axis
-zero_list = [0] * 4
-step_list = [i * step for i in range(4)]
-
-### Containers used to store point coordiantes for multi-line plotting
-ContainerX = np.empty((CoreCount,),  dtype = object)
-ContainerY = np.empty((CoreCount,), dtype =  object)
-line_colours = []
-for i in range(len(ContainerY)): 
-    ContainerY[i]=[0,0,0,0]
-    ContainerX[i]=step_list 
-    line_colours.append(random.choice(palette2))
-
-### empty plot data, to be filled during live run
-liveLineO = liveLine.multi_line(xs = [], ys= [], line_color = []) 
-liveLine_ds = liveLineO.data_source
+line_window = state.line_window     ## number of points kept for every line, by the shared state
+
+## Number of lines drawn for every hierarchy level of the live line
+line_counts = {"THREAD"  : ThreadCount,
+               "CORE"    : CoreCount,
+               "MAILBOX" : MailboxCount,
+               "BOARD"   : BoardCount,
+               "BOX"     : BoxCount}
+line_view = "CORE"     # Hierarchy level shown by the live line
+
+### Levels with more lines than line_top are drawn at a lower level of detail: only the line_top lines most active
+### at the latest tick are sent, plus the lines pinned by tapping them, by tapping their heatmap tile or by searching
+### their index. The spread of all the lines is drawn behind them as a band, computed by the server every tick
+line_top = int(os.environ.get("POETS_LINE_TOP", "32"))
+line_shown = None       ## lines whose segments are sent
+line_pinned = set()     ## lines always sent in full
+envelope_ds = ColumnDataSource(data={'x' : [], 'low' : [], 'q1' : [], 'median' : [], 'q3' : [], 'high' : []})
+liveLine.varea(x='x', y1='low', y2='high', source = envelope_ds, fill_color = "grey", fill_alpha = 0.15)
+liveLine.varea(x='x', y1='q1', y2='q3', source = envelope_ds, fill_color = "grey", fill_alpha = 0.3)
+liveLine.line(x='x', y='median', source = envelope_ds, line_color = "black", line_dash = "dashed")
+
+### Each line is drawn as the segments joining its consecutive points. Every tick streams one new segment per line
+### and the rollover drops the oldest ones, so only the newest points are sent to the browser. Segments at zero at
+### both ends are not sent, so idle parts of the machine cost nothing.
+### The shared state keeps the last line_window frames of every level, and every level has its own renderer, source
+### and colours, made once. Switching level shows its renderer and refills its source from the frames kept, so the
+### lines keep their history and only the level shown is streamed
+line_frame = None       ## number of the latest frame drawn by the live line, None to draw every frame kept
+line_latest = None      ## values of the latest frame drawn, for every line of the level shown
+line_rows = collections.deque(maxlen = line_window - 1)     ## segments sent for each of the last ticks
+line_colours = {level : np.random.randint(0, len(palette2), count).astype(np.uint8) for level, count in line_counts.items()}
+line_entities = {level : np.arange(count, dtype=np.int32) for level, count in line_counts.items()}  ## index shown by the hover tool
+line_renderers = dict()
+for level in line_counts:
+    line_renderers[level] = liveLine.segment(x0 = 'x0', y0 = 'y0', x1 = 'x1', y1 = 'y1',
+                                             source = ColumnDataSource(data={'x0' : [], 'y0' : [], 'x1' : [], 'y1' : [], 'colour' : [], 'entity' : []}),
+                                             line_color = linear_cmap(field_name="colour", palette=palette2, low=0, high=len(palette2)-1),
+                                             visible = (level == line_view))
+line_sources = {level : renderer.data_source for level, renderer in line_renderers.items()}
+hover2.renderers = list(line_renderers.values())
 TOOLS="hover,crosshair,undo,redo,reset,tap,save,pan"
 
 
@@ -169,13 +181,13 @@ line = figure(width = 700, title = "Line Graph", tools = TOOLS, tooltips = TOOLT
 line.toolbar.logo = None
 line.xaxis.formatter = PrintfTickFormatter(format="%ss")
 
-Hit_line = line.line(x=[], y=[], legend="Cache Hit")
-Miss_line = line.line(x=[], y=[], legend="Cache Miss", color = "red")
-WB_line = line.line(x=[], y=[], legend="Cache WB", color = "green")
-
-Hit_line_ds = Hit_line.data_source
-Miss_line_ds = Miss_line.data_source
-WB_line_ds = WB_line.data_source
+### Each line shows the mean of the pyramid level served, and a band its min and max
+Hit_line_ds = ColumnDataSource(data={'x' : [], 'y' : [], 'low' : [], 'high' : []})
+Miss_line_ds = ColumnDataSource(data={'x' : [], 'y' : [], 'low' : [], 'high' : []})
+WB_line_ds = ColumnDataSource(data={'x' : [], 'y' : [], 'low' : [], 'high' : []})
+for ds, colour, label in [(Hit_line_ds, "#1f77b4", "Cache Hit"), (Miss_line_ds, "red", "Cache Miss"), (WB_line_ds, "green", "Cache WB")]:
+    line.varea(x='x', y1='low', y2='high', source = ds, fill_color = colour, fill_alpha = 0.2)
+    line.line(x='x', y='y', source = ds, legend_label = label, color = colour)
 
 #Separated figure for the range selector, which allows to zoom in a specific section of time
 select = figure(width = 550, title="Drag the middle and edges of the selection box to change the range above",
@@ -194,7 +206,7 @@ range_tool_active = 0
 #Configurations for Bar Chart - Used for CPUIDLE count
 TOOLS="hover,crosshair,undo,redo,reset,tap,save, pan, zoom_in,zoom_out,"
 
-TOOLTIPS = [("second", "$index"),
+TOOLTIPS = [("second", "@x"),
             ("percentage", "@top")]
 
 bar = figure(height = 580, width = 500, title="Bar Chart", name = "bar",
@@ -208,24 +220,61 @@ bar.xaxis.formatter = PrintfTickFormatter(format="%ss")
 bar.yaxis.ticker = SingleIntervalTicker(interval=10)
 bar.xaxis.ticker = SingleIntervalTicker(interval= 10)
 
-barO = bar.vbar(x=[], top = [], width=0.2, color="#718dbf")
+barO = bar.vbar(x='x', top = 'top', width='width', color="#718dbf", source = ColumnDataSource(data={'x' : [], 'top' : [], 'width' : []}))
 bar_ds = barO.data_source
 
 ## specified initial values in order to show graph even before application runs
 initial = dict()
 initial['x'] = [0]
 initial['top'] = [0]
+initial['width'] = [0.2]
 bar_ds.data = initial
 
-## values used to calculate percentage of idle time
-idle_divider1 = CoreCount*2100000 ## freq is 210 MHz
-idle_divider2 = CoreCount/100
+## Archived run overlaid on the cache and idle charts as dashed lines, see poets.archive
+overlay_line_ds = ColumnDataSource(data={'x' : [], 'miss' : [], 'hit' : [], 'wb' : []})
+for field, colour in [("hit", "#1f77b4"), ("miss", "red"), ("wb", "green")]:
+    line.line(x='x', y=field, source = overlay_line_ds, color = colour, line_dash = "dashed")
+overlay_bar_ds = ColumnDataSource(data={'x' : [], 'idle' : []})
+bar.line(x='x', y='idle', source = overlay_bar_ds, color = "black", line_dash = "dashed")
+
+#Configurations for the detail panel - Subtree of the heatmap tile tapped, only its data is sent
+detail_window = 60      ## ticks of TX/s history shown for every child
+detail_seconds = 60     ## seconds of cache history shown for the subtree
+detail = None           ## (level, index) of the tapped tile, None until a tile is tapped
+detail_ring = None      ## ring buffer of the TX/s of the children of the tapped tile
+detail_subtree = None   ## (child level, child indices, cores) of the tapped tile
+detail_frame = None     ## number of the latest frame drawn by the detail panel
+
+detail_live = figure(height = 300, width = 700, title = "Tap a heatmap tile", tools = "hover,pan,wheel_zoom,reset,save",
+                     tooltips = [("child", "@child"), ("TX/s", "$y")], toolbar_location="below")
+detail_live.toolbar.logo = None
+detail_live.xaxis.formatter = PrintfTickFormatter(format="%ds")
+detail_live.yaxis.formatter = PrintfTickFormatter(format="%d TX")
+detail_live_ds = ColumnDataSource(data={'xs' : [], 'ys' : [], 'child' : [], 'colour' : []})
+detail_live.multi_line(xs='xs', ys='ys', line_color='colour', source = detail_live_ds)
+
+detail_cache = figure(height = 300, width = 700, title = "Cache of the subtree, per core", tools = "hover,pan,wheel_zoom,reset,save",
+                      tooltips = [("second", "@x"), ("value", "$y")], y_axis_type="log", toolbar_location="below")
+detail_cache.toolbar.logo = None
+detail_cache.xaxis.formatter = PrintfTickFormatter(format="%ss")
+detail_cache_ds = ColumnDataSource(data={'x' : [], 'miss' : [], 'hit' : [], 'wb' : []})
+for field, colour, label in [("hit", "#1f77b4", "Cache Hit"), ("miss", "red", "Cache Miss"), ("wb", "green", "Cache WB")]:
+    detail_cache.line(x='x', y=field, source = detail_cache_ds, color = colour, legend_label = label)
+detail_layout = row(detail_live, detail_cache, name="detail")
+
+## Frames waiting in the channel of this session and frames it dropped, how far rendering lags behind
+channel_div = Div(text = "", name = "channel", width = 300)
+channel_shown = None            ## depth, max depth and drops last shown
+
+## History of the cache and idle charts, kept at several resolutions by the shared state
+history_version = -1            ## version of the shared history last served
+history_stale = False           ## the range of the line graph changed since its data was served
 
 
 ## Configuration for table showing post-run parameters
-execution_array = [0] * 10
-usage_array = [0] * 10
-tdata = {'Application' : range(1,11),
+execution_array, usage_array = state.table()
+table_version = -1              ## version of the shared table last served
+tdata = {'Application' : range(1, live.TABLE_ROWS + 1),
             'Execution Time' : execution_array,
             'Average Utilisation': usage_array,}  
 source = ColumnDataSource(data=tdata)
@@ -241,416 +290,365 @@ table = DataTable(source=source, columns=columns, height=150, width=700, name="t
 table_ds = table.source
 
 
-finished = 0 # Variable used to indicate end of run
-block = 0 # Variable used to freeze the Heatmap
-gap1 = 16
-gap2 = CoreCount
-clear = 0
-x_c = 1
-final_plot = 0
+def archiveOptions():
+    ''' Entries of the archived run selector, newest run first '''
+    if(state.archive is None):
+        return [("", "No run archive, set POETS_ARCHIVE")]
+    options = [("", "None")]
+    for run in state.archived_runs():
+        finished = time.strftime("%d/%m %H:%M", time.localtime(run["finished"]))
+        options.append((str(run["id"]), "Run " + str(run["id"]) + " - " + finished + " - " + str(run["seconds"]) + " s - "
+                        + str(round(run["utilisation"])) + " TX/s"))
+    return options
+
+archive_select = Select(title = "Overlay archived run", value = "", options = archiveOptions(), name = "archive", width = 400)
 
 
-def signal_handler(*args, **kwargs):
-    print("\nTerminating Visualiser...")
-    sock.close()
-    print(f"active  {threading.active_count()}")
-    sys.exit(0)
+block = 0 # Variable used to freeze the Heatmap
 
 
 def stopper():
     global block
     print("STOPPING live updates")
     block = ~block
+    scheduleUpdate()        ## catch up with what was published while blocked
 
 def clicker_h(event):
-    global gap1, selected_count_x, selected_count_y, max_colour
+    global heatmap_view
     print(event.item + str(" VIEW FOR LIVE HEATMAP"))
-    heatmap.renderers = []
-
-    if event.item == "CORE":
-        gap1 = 16
-        selected_count_x = core_count_x
-        selected_count_y = core_count_y
-        max_colour = 1000
-        heatmap.tools[0].tooltips = [("core", "$index"),
-                                    ("TX/s", "@intensity")]
-                            
-    elif event.item == "MAILBOX":
-        gap1 = 64
-        selected_count_x = mailbox_count_x
-        selected_count_y = mailbox_count_y
-        max_colour = 500
-        heatmap.tools[0].tooltips = [("mailbox", "$index"),
-                                    ("TX/s", "@intensity")]
-                                    
-    elif event.item == "BOARD":
-        gap1 = 1024
-        selected_count_x = board_count_x
-        selected_count_y = board_count_y
-        max_colour = 200
-        heatmap.tools[0].tooltips = [("board", "$index"),
-                                    ("TX/s", "@intensity")]
+
+    heatmap_renderers[heatmap_view].visible = False
+    heatmap_view = event.item
+    heatmap_renderers[heatmap_view].visible = True
+    bar_map.high = heatmap_levels[heatmap_view][2]
+    heatmap.title.text = "Heat Map"
+    heatmap.tools[0].tooltips = [(heatmap_view.lower(), "$index"),
+                                ("TX/s", "@intensity")]
+    state.show(session_key, heatmap_view)       ## frames published from now on hold this level
+    numbers, values = state.line_points(heatmap_view, until = shown_frame)     ## the frame shown, kept by the shared state
+    if(len(numbers)):
+        heatmapUpdater(values[:, -1])
+
+
+def tileAt(x, y):
+    ''' Tile of the visible heatmap level at the given plot coordinates, found from the tile grid, or None '''
+    width = topology.grid_widths[heatmap_view]
+    column_index = int(np.floor(x + 0.5))     ## tiles are one unit wide and two high, centred on their coordinates
+    tile = int(np.floor((y + 1) / 2)) * width + column_index
+    if(0 <= column_index < width) and (0 <= tile < len(heatmap_shown[heatmap_view])):
+        return tile
+    return None
+
+def heatmapHover(event):
+    ''' Shows in the title the tile under the mouse of a raster level '''
+    if(heatmap_view not in raster_levels):
+        return
+    tile = tileAt(event.x, event.y)
+    if(tile is not None):
+        heatmap.title.text = "Heat Map - " + heatmap_view.lower() + " " + str(tile) + ": " + str(heatmap_shown[heatmap_view][tile]) + " TX/s"
     else:
-        gap1 = 6144
-        selected_count_x = box_count_x
-        selected_count_y = box_count_y
-        max_colour = 100
-        heatmap.tools[0].tooltips = [("box", "$index"),
-                                    ("TX/s", "@intensity")]
+        heatmap.title.text = "Heat Map"
+
+def heatmapTap(event):
+    ''' Opens the tapped tile in the detail panel, starting with the frames and seconds the shared state holds '''
+    global detail, detail_ring, detail_subtree, detail_frame
+    tile = tileAt(event.x, event.y)
+    if(tile is None):
+        return
+    print(heatmap_view + " " + str(tile) + str(" OPENED IN DETAIL PANEL"))
+    detail = (heatmap_view, tile)
+    child, children, values, cores = state.subtree(*detail)
+    detail_subtree = (child, children, cores)
+    detail_ring = RingBuffer(len(children), detail_window)
+    detail_frame = None         ## every frame of the children kept by the shared state
+    detail_live.title.text = heatmap_view.capitalize() + " " + str(tile) + " - TX/s of every " + child.lower()
+    detail_cache.title.text = "Cache of " + heatmap_view.lower() + " " + str(tile) + ", mean over " + str(len(cores)) + " cores"
+    detailUpdater()
+    if(heatmap_view == line_view):      ## the tile is also a line of the live line
+        line_pinned.add(tile)
+        showLines()
+
+def detailUpdater():
+    ''' Sends the detail panel the subtree of the tapped tile only, sliced from the shared state on demand:
+        the frames of its children published since it was last drawn and the latest seconds of its cores '''
+    global detail_frame
+    child, children, cores = detail_subtree
+    numbers, values = state.line_points(child, detail_frame, children, shown_frame)
+    if not(len(numbers)):
+        return      ## the frame shown is older than every frame kept
+    for i in range(0 if detail_frame is None else 1, len(numbers)):     ## the first frame given was drawn already
+        detail_ring.append(numbers[i] * step, values[:, i])
+    detail_frame = int(numbers[-1])
+    times, data = detail_ring.ordered()
+    colours = Category20[20]
+    detail_live_ds.data = {'xs' : [times] * len(children),
+                           'ys' : list(data),
+                           'child' : children,
+                           'colour' : [colours[i % len(colours)] for i in range(len(children))]}
+
+    end = state.cores.seconds
+    start = max(end - detail_seconds, 0)
+    counters = state.core_history(cores, start, end) / len(cores)
+    detail_cache_ds.data = {'x' : np.arange(start, start + len(counters)) + 1,      ## chart x is second + 1
+                            'miss' : counters[:, live.MISS],
+                            'hit' : counters[:, live.HIT],
+                            'wb' : counters[:, live.WB]}
+
+def heatmapLeave(event):
+    heatmap.title.text = "Heat Map"
 
 
 def clicker_l(event):
-    global ContainerX, ContainerY, line_colours, gap2
+    global line_view, line_frame
     print(event.item + str(" VIEW FOR LIVE LINE"))
 
-    if event.item == "CORE":
-        ContainerX = np.empty((CoreCount,),  dtype = object)
-        ContainerY = np.empty((CoreCount,), dtype =  object)
-        line_colours = []
-        for i in range(len(ContainerY)): 
-            ContainerY[i]=[0,0,0,0]
-            ContainerX[i]=step_list 
-            line_colours.append(random.choice(palette2)) 
-        gap2 = CoreCount
-        liveLine.tools[0].tooltips = [("core", "$index")]
-
-    elif event.item == "THREAD":
-        ContainerX = np.empty((ThreadCount,),  dtype = object)
-        ContainerY = np.empty((ThreadCount,), dtype =  object)
-        line_colours = []
-        for i in range(len(ContainerY)): 
-            ContainerY[i]=[0,0,0,0]
-            ContainerX[i]=step_list 
-            line_colours.append(random.choice(palette2))
-        gap2 = ThreadCount
-        liveLine.tools[0].tooltips = [("thread", "$index")]
-
-    elif event.item == "MAILBOX":
-        ContainerX = np.empty((MailboxCount,),  dtype = object)
-        ContainerY = np.empty((MailboxCount,), dtype =  object)
-        line_colours = []
-        for i in range(len(ContainerY)): 
-            ContainerY[i]=[0,0,0,0]
-            ContainerX[i]=step_list 
-            line_colours.append(random.choice(palette2))
-        gap2 = MailboxCount
-        liveLine.tools[0].tooltips = [("mailbox", "$index")]
-                                    
-    elif event.item == "BOARD":
-        ContainerX = np.empty((BoardCount,),  dtype = object)
-        ContainerY = np.empty((BoardCount,), dtype =  object)
-        line_colours = []
-        for i in range(len(ContainerY)): 
-            ContainerY[i]=[0,0,0,0]
-            ContainerX[i]=step_list 
-            line_colours.append(random.choice(palette2))
-        gap2 = BoardCount
-        liveLine.tools[0].tooltips = [("board", "$index")]
-
-    else:
-        ContainerX = np.empty((BoxCount,),  dtype = object)
-        ContainerY = np.empty((BoxCount,), dtype =  object)
-        line_colours = []
-        for i in range(len(ContainerY)): 
-            ContainerY[i]=[0,0,0,0]
-            ContainerX[i]=step_list 
-            line_colours.append(random.choice(palette2))
-        gap2 = BoxCount
-        liveLine.tools[0].tooltips = [("box", "$index")]
-
-    mainQueue.put(empty)
-
-
-
-
-def dataUpdater():
-    print(" IN DATA UPDATER ")
-    global ThreadLevel, cacheDataMiss1, cacheDataHit1, cacheDataWB1, CPUIdle1, finished, maxRow, entered, plot, counter1, clear, biggest, final_plot, clear_column
-    idx = 0
-    counter1 = 0
-    cacheDataMiss1 = 0
-    cacheDataHit1 = 0
-    cacheDataWB1 = 0
-    CPUIdle1 = 0
-    counter = [0] * 10 
-    cacheDataMiss = [0] * 10
-    cacheDataHit = [0] * 10
-    cacheDataWB = [0] * 10
-    CPUIdle = [0] * 10
-    plot = 0
-    group = 0
-    biggest = 1
-    #### FPGA coordinates list used to transform non contiguous addresses into contiguous ones
-    FPGA_coords = [0] * 47 # 48 entries because it supports 8 POETS box hence 48 working FPGAs
-    mask1 = 0b0000001111111111 
-    final_plot
-    f = 1
-    clear_column = 0
- 
-    while True:
-        try:
-            data, address = sock.recvfrom(65535)   
-            msg = data.decode("utf-8")
-            if(clear):
-                maxRow = 0
-                clear_column = 1
-                FPGA_coords = [0] * 47
-                f = 1
-                clear = 0
-
-            entered = 1
-            splitMsg = msg.split(API_DELIMINATOR)
-            idx = int(float(splitMsg[0]))
-
-            ############ FPGA field corresponds to the six MSB bits of the thread address, the following conversion makes the address range contiguous
-
-            FPGA_field = bin(idx)[2:-10]
-            if(FPGA_field):            ## IF FPGA FIELD IS DIFFERENT THAN ZERO AND IT EXISTS DO CONVERSION
-                if FPGA_field in FPGA_coords:
-                    new_field = FPGA_coords.index(FPGA_field) + 1
-                    mask2 = (new_field << 10)
-                else:
-                    FPGA_coords[f] = FPGA_field
-                    print(str(f) + " FPGA boards active")
-                    f = (f+1)%47
-                    mask2 = (f << 10)
-                idx = (idx & mask1) | mask2
-
-            if(idx > biggest):
-                biggest = idx
-            cidx = int(float(splitMsg[1]))
-            if idx < ThreadCount and idx >= 0:
-                ThreadLevel[idx] = int(float(splitMsg[7]))                   
-                div = int(idx/n)
-                if not idx%n and div < CoreCount:        ## Take only Thread 0 of each core as a representative of the entire core counter
-                    if(maxRow < cidx):       
-                        maxRow = cidx
-                        group += 1
-                    
-                    if(group == 10):                    ## After every ten seconds of data refresh counters
-                        group = 0
-                        plot += 1                      
-                        CPUIdle1 = CPUIdle + []
-                        CPUIdle = [0] * 10
-                        cacheDataMiss1 = cacheDataMiss + []
-                        cacheDataMiss = [0] * 10
-                        cacheDataHit1 = cacheDataHit + []
-                        cacheDataHit = [0] * 10
-                        cacheDataWB1 = cacheDataWB + []
-                        cacheDataWB = [0] * 10
-                        counter1 = counter + []
-                        counter = [0] * 10
-
-                    cacheDataMiss[group] += (int(float(splitMsg[3])))
-                    cacheDataHit[group] += (int(float(splitMsg[4])))
-                    cacheDataWB[group] += (int(float(splitMsg[5])))
-                    CPUIdle[group] += int((float(splitMsg[6])))
-                    counter[group] += 1
-            else:
-                print("idx range is out of bound")
-        except socket.timeout:
-            if(entered):
-                group = 0
-                final_plot = 10 - (maxRow%10)
-                CPUIdle1 = CPUIdle + []
-                CPUIdle = [0] * 10
-                cacheDataMiss1 = cacheDataMiss + []
-                cacheDataMiss = [0] * 10
-                cacheDataHit1 = cacheDataHit + []
-                cacheDataHit = [0] * 10
-                cacheDataWB1 = cacheDataWB + []
-                cacheDataWB = [0] * 10
-                counter1 = counter + []
-                counter = [0] * 10            
-                print(disconnect_msg)
-                finished = 1      ##after finishing the run display table data
-                entered = 0
-        except Exception as e:
-            print("issue on thread " + str(idx) + " because: " + str(e))
-
-def bufferUpdater():
-    global mainQueue, total
-    while True:
-        if(entered) and not ((ThreadLevel==current_data).all()):        ## Queue new data in order to avoid losing it in case of slow rendering
-            mainQueue.put(ThreadLevel, False)
-            for e in range(biggest+1):
-                total += np.sum(ThreadLevel[e])
-        time.sleep(0.9)
+    line_renderers[line_view].visible = False
+    line_view = event.item
+    line_renderers[line_view].visible = True
+    line_pinned.clear()     ## indices of another level
+    line_search.value = ""
+    liveLine.tools[0].tooltips = [(line_view.lower(), "@entity")]
+
+    line_frame = None       ## the level shown is drawn again with every frame kept
+    liveLineUpdater()
+
+
+def liveLineRows(numbers, values):
+    ''' Segments joining the consecutive frames given of the shown lines not idle at both ends, as one set of columns '''
+    segments = []
+    for i in range(len(numbers) - 1):
+        y0, y1 = values[:, i], values[:, i + 1]
+        active = ((y0 != 0) | (y1 != 0)) & line_shown
+        count = int(active.sum())
+        segments.append({'x0' : np.full(count, numbers[i] * step),
+                         'y0' : y0[active],
+                         'x1' : np.full(count, numbers[i + 1] * step),
+                         'y1' : y1[active],
+                         'colour' : line_colours[line_view][active],
+                         'entity' : line_entities[line_view][active]})
+        line_rows.append(count)
+    return {k : np.concatenate([segment[k] for segment in segments]) for k in segments[0]}
+
+def liveLineUpdater():
+    ''' Sends the live line the frames published since it was last drawn, or redraws it with every frame kept
+        by the shared state after the level shown changed '''
+    global line_frame, line_latest
+    redraw = line_frame is None
+    numbers, values = state.line_points(line_view, line_frame, until = shown_frame)
+    if(len(numbers) < 2):
+        return      ## nothing new
+    line_frame = int(numbers[-1])
+    line_latest = values[:, -1]
+    count = line_counts[line_view]
+    if(redraw):
+        if(count > line_top):
+            liveLine.title.text = "Live Instrumentation - " + str(line_top) + " most active of " + str(count) + " " + line_view.lower() + "s, band: spread of all"
+        else:
+            liveLine.title.text = "Live Instrumentation"
+        line_rows.clear()
+
+    envelope = {k : [] for k in envelope_ds.data}
+    if(count > line_top):
+        for i in range(0 if redraw else 1, len(numbers)):      ## the first frame given was drawn already
+            for k, value in zip(envelope, [numbers[i] * step] + lineEnvelope(values[:, i])):
+                envelope[k].append(value)
+    showLines()     ## the most active lines of this tick
+    rows = liveLineRows(numbers, values)
+
+    source = line_sources[line_view]
+    if(redraw):
+        envelope_ds.data = envelope
+        source.data = rows
+        return
+    if(envelope['x']):
+        envelope_ds.stream(envelope, rollover = line_window)
+    if(sum(line_rows)):
+        source.stream(rows, rollover = sum(line_rows))     ## keeps the segments of the last line_window - 1 ticks
+    elif(len(source.data['x0'])):
+        source.data = rows         ## the whole window is idle
+
+
+def showLines():
+    ''' Chooses the lines sent: all of them on small levels, otherwise the line_top most active at the
+        latest tick and the pinned ones '''
+    global line_shown
+    count = line_counts[line_view]
+    if(count <= line_top):
+        line_shown = np.ones(count, dtype=bool)
+        return
+    line_shown = np.zeros(count, dtype=bool)
+    line_shown[np.argpartition(line_latest, -line_top)[-line_top:]] = True
+    line_shown[[entity for entity in line_pinned if entity < count]] = True
+
+def lineEnvelope(values):
+    ''' Minimum, quartiles and maximum of the lines reporting at one tick '''
+    values = values[values != 0]
+    if not(len(values)):
+        return [0] * 5
+    return np.percentile(values, [0, 25, 50, 75, 100]).tolist()
+
+def linePinned(attr, old, new):
+    ''' Pins the lines tapped on the live line, or unpins them when tapped again '''
+    source = line_sources[line_view]
+    if not(new) or (new != source.selected.indices):      ## cleared, or a hidden level
+        return
+    tapped = {int(source.data['entity'][i]) for i in new if i < len(source.data['entity'])}
+    line_pinned.symmetric_difference_update(tapped)
+    print("PINNED " + line_view.lower() + "s " + str(sorted(line_pinned)))
+    source.selected.indices = []
+    showLines()
+
+def lineSearch(attr, old, new):
+    ''' Pins the lines typed in the search box, as indices and ranges such as "12, 40-43" '''
+    line_pinned.clear()
+    for part in new.replace(" ", "").split(","):
+        first, _, last = part.partition("-")
+        if not(first.isdigit()) or not(last.isdigit() or last == ""):
+            continue
+        line_pinned.update(range(int(first), min(int(last or first), line_counts[line_view] - 1) + 1))
+    print("PINNED " + line_view.lower() + "s " + str(sorted(line_pinned)))
+    showLines()
+
+def heatmapUpdater(level_data):
+    ''' Sends the intensities of the visible heatmap level to the browser. Only the tiles that changed are
+        patched, the whole column is replaced when most of them changed since one message is then cheaper.
+        Raster levels are sent as one image whenever a tile changed '''
+    shown = heatmap_shown[heatmap_view]
+    intensity = np.zeros(len(shown), dtype=np.int64)  ## Missing tiles are automatically set to zero intensity
+    level_data = level_data[:len(shown)]
+    intensity[:len(level_data)] = level_data
+
+    changed = np.flatnonzero(intensity != shown)
+    if(heatmap_view in raster_levels):
+        if(len(changed)):
+            rows, width = heatmap_sources[heatmap_view].data['image'][0].shape
+            image = np.zeros(rows * width, dtype=np.uint32)
+            image[:len(intensity)] = heatmap_luts[heatmap_view][np.minimum(intensity, (1 << 16) - 1)]
+            heatmap_sources[heatmap_view].data = {'image' : [image.reshape(rows, width)]}
+    elif(len(changed) > len(shown) // 2):
+        heatmap_sources[heatmap_view].data['intensity'] = intensity.tolist()
+    elif(len(changed)):
+        heatmap_sources[heatmap_view].patch({'intensity' : list(zip(changed.tolist(), intensity[changed].tolist()))})
+    heatmap_shown[heatmap_view] = intensity
+
+def serveHistory():
+    ''' Sends the cache and idle charts the pyramid level matching the range they show. The line graph
+        gets the visible range selected with the RangeTool plus one range either side, so panning
+        shows data before the next refresh; the bar chart and the range selector show the whole run. '''
+    global history_stale
+    history_stale = False
+    start, end = line.x_range.start, line.x_range.end
+    span = max(end - start, 1)
+    visible = state.history_series(span, start - 1 - span, end - 1 + span)   ## chart x is second + 1
+    for ds, value in [(Miss_line_ds, live.H_MISS), (Hit_line_ds, live.H_HIT), (WB_line_ds, live.H_WB)]:
+        ds.data = {'x' : visible['x'] + 1,
+                   'y' : visible['mean'][:, value],
+                   'low' : visible['low'][:, value],
+                   'high' : visible['high'][:, value]}
+
+    whole = state.whole_history()
+    bar_ds.data = {'x' : whole['x'] + 1,
+                   'top' : whole['mean'][:, live.H_IDLE],
+                   'width' : np.full(len(whole['x']), 0.2 * whole['factor'])}
+    select_ds.data = {'x' : whole['x'] + 1,
+                      'y' : whole['mean'][:, live.H_WB]}
+
+def overlayRun(attr, old, new):
+    ''' Overlays the archived run selected, its series are read from the archive without replaying the run '''
+    if not(new):
+        overlay_line_ds.data = {'x' : [], 'miss' : [], 'hit' : [], 'wb' : []}
+        overlay_bar_ds.data = {'x' : [], 'idle' : []}
+        return
+    print("OVERLAYING archived run " + new)
+    series = state.archived_series(int(new))
+    x = series["second"] + 1        ## chart x is second + 1
+    overlay_line_ds.data = {'x' : x, 'miss' : np.array(series["miss"]), 'hit' : np.array(series["hit"]), 'wb' : np.array(series["wb"])}
+    overlay_bar_ds.data = {'x' : x, 'idle' : np.array(series["idle"])}
+
+def rangeChanged(attr, old, new):
+    global history_stale
+    history_stale = True        ## served on the next tick, once however many range events arrived
+    scheduleUpdate()
+
+def scheduleUpdate():
+    ''' Called by the shared state whenever it changed, possibly from its own thread, and by the widgets.
+        Document updates run on the next tick of the server loop instead of polling at a fixed rate '''
+    global update_scheduled
+    if not(update_scheduled):
+        update_scheduled = True
+        doc.add_next_tick_callback(plotterUpdater)      ## the only thread-safe Document method
+
+def channelUpdater():
+    ''' Shows the metrics of the frame channel of this session, and logs the frames it drops '''
+    global channel_shown
+    stats = mainQueue.stats()
+    shown = (stats["depth"], stats["max_depth"], stats["dropped"])
+    if(shown == channel_shown):
+        return
+    if(channel_shown is not None) and (stats["dropped"] > channel_shown[2]):
+        print(str(stats["dropped"] - channel_shown[2]) + " frames dropped by session " + str(session_key) + ", rendering lags")
+    channel_shown = shown
+    channel_div.text = ("Frames waiting: " + str(stats["depth"]) + " of " + str(stats["capacity"]) +
+                        " (max " + str(stats["max_depth"]) + "), dropped: " + str(stats["dropped"]))
 
 def plotterUpdater():
-    global finished, usage, range_tool_active, current_data, plot, total, clear, x_c, execution_array, usage_array, final_plot, clear_column
+    global range_tool_active, history_version, table_version, update_scheduled, shown_frame
+    update_scheduled = False
 
     if not(block):    
-        if not (mainQueue.empty()):
-            
-            current_data = mainQueue.get()
-            print(mainQueue.qsize())
-
-            if(gap1 == 16):                     ## CORE VIEW
-                HeatmapLevel = [sum(current_data[j:j+n])//n for j in range(0, biggest +1 ,n)]
-
-            elif(gap1 == 64):                   ## MAILBOX VIEW
-                HeatmapLevel = [sum(current_data[j:j+gap1])//gap1 for j in range(0, biggest + 1, gap1)]
-
-            elif(gap1 == 1024):                 ## BOARD VIEW
-                HeatmapLevel = [sum(current_data[j:j+gap1])//gap1 for j in range(0, biggest + 1 , gap1)]
-
-            else:                               ## BOX VIEW
-                HeatmapLevel = [sum(current_data[j:j+biggest])//gap1 for j in range(0, biggest + 1, biggest)]
-
-            if(gap2 == CoreCount):              ## CORE VIEW 
-                if(gap1 == 16):
-                    LineLevel = HeatmapLevel
-                else:
-                    LineLevel = [sum(current_data[j:j+n])//n for j in range(0, biggest + 1 ,n)]
-            
-            elif(gap2 == MailboxCount):         ## MAILBOX VIEW 
-                if(gap1 == 64):
-                    LineLevel = HeatmapLevel
-                else:
-                    LineLevel = [sum(current_data[j:j+64])//64 for j in range(0, biggest + 1 ,64)]
-
-            elif(gap2 == ThreadCount):          ## THREAD VIEW
-                LineLevel = ThreadLevel[0:biggest+1]
-
-            elif(gap2 == BoardCount):           ## BOARD VIEW 
-                if(gap1 == 1024):
-                    LineLevel = HeatmapLevel
-                else:
-                    LineLevel = [sum(current_data[j:j+1024])//1024 for j in range(0, biggest + 1 ,1024)]
-            
-            else:
-                if(gap1 == 6144):               ## BOX VIEW 
-                    LineLevel = HeatmapLevel
-                else:
-                    LineLevel = [sum(current_data[j:j+6144])//6144 for j in range(0, biggest + 1,6144)]
-
-
-
-            heatmap_data = {'x' : selected_count_x,
-                'y' : selected_count_y,
-                'intensity': HeatmapLevel + [0] * (len(selected_count_x) - len(HeatmapLevel))}  ## Missing tiles are automatically set to zero intensity
-
-            #create a ColumnDataSource by passing the dict
-            heat_source = ColumnDataSource(data=heatmap_data)
-            latest = ContainerX[0][-1] + step
-            l = len(LineLevel)
-            for i in range(l):
-                ContainerY[i].append(LineLevel[i])
-                ContainerY[i].pop(0)        
-
-            ContainerX[0].append(latest)
-            ContainerX[0].pop(0)        # All X values change equally since ContainerX arrays are all connected
-            new_data_liveLine = {'xs' : ContainerX,
-                'ys' : ContainerY,
-                'line_color' : line_colours }
-
-            liveLine_ds.data = new_data_liveLine
-            mapper = linear_cmap(field_name="intensity", palette=colours, low=0, high= max_colour )
-            heatmap.rect(x='x',  y='y', width = 1, height = 2, source = heat_source, fill_color=mapper, line_color = "grey")
-
-
-        if(plot) or (final_plot):
-
-            dataBar = dict()
-            dataBar['x'] = bar_ds.data['x'] + [x_c] + [x_c+1] + [x_c+2] + [x_c+3] + [x_c+4] + [x_c+5] + [x_c+6] + [x_c+7] + [x_c+8] + [x_c+9]
-            dataBar['top'] = bar_ds.data['top'] + [(CPUIdle1[0]/idle_divider1 + (CoreCount-counter1[0])/idle_divider2)] + [(CPUIdle1[1]/idle_divider1 + (CoreCount-counter1[1])/idle_divider2)] + [(CPUIdle1[2]/idle_divider1 + (CoreCount-counter1[2])/idle_divider2)] + [(CPUIdle1[3]/idle_divider1 + (CoreCount-counter1[3])/idle_divider2)] + [(CPUIdle1[4]/idle_divider1 + (CoreCount-counter1[4])/idle_divider2)] + [(CPUIdle1[5]/idle_divider1 + (CoreCount-counter1[5])/idle_divider2)] + [(CPUIdle1[6]/idle_divider1 + (CoreCount-counter1[6])/idle_divider2)] + [(CPUIdle1[7]/idle_divider1 + (CoreCount-counter1[7])/idle_divider2)] + [(CPUIdle1[8]/idle_divider1 + (CoreCount-counter1[8])/idle_divider2)] + [(CPUIdle1[9]/idle_divider1 + (CoreCount-counter1[9])/idle_divider2)]
-            
-            dataMiss = dict()
-            dataMiss['x'] = Miss_line_ds.data['x'] + [x_c] + [x_c+1] + [x_c+2] + [x_c+3] + [x_c+4] + [x_c+5] + [x_c+6] + [x_c+7] + [x_c+8] + [x_c+9]
-            dataMiss['y'] = Miss_line_ds.data['y'] + [(cacheDataMiss1[0]/CoreCount)] + [(cacheDataMiss1[1]/CoreCount)] + [(cacheDataMiss1[2]/CoreCount)]  + [(cacheDataMiss1[3]/CoreCount)] + [(cacheDataMiss1[4]/CoreCount)] + [(cacheDataMiss1[5]/CoreCount)] + [(cacheDataMiss1[6]/CoreCount)] + [(cacheDataMiss1[7]/CoreCount)]  + [(cacheDataMiss1[8]/CoreCount)] + [(cacheDataMiss1[9]/CoreCount)]
-
-            dataHit = dict()
-            dataHit['x'] = Hit_line_ds.data['x'] +[x_c] + [x_c+1] + [x_c+2] + [x_c+3] + [x_c+4] + [x_c+5] + [x_c+6] + [x_c+7] + [x_c+8] + [x_c+9]
-            dataHit['y'] = Hit_line_ds.data['y'] + [(cacheDataHit1[0]/CoreCount)] + [(cacheDataHit1[1]/CoreCount)] + [(cacheDataHit1[2]/CoreCount)] + [(cacheDataHit1[3]/CoreCount)] + [(cacheDataHit1[4]/CoreCount)] + [(cacheDataHit1[5]/CoreCount)] + [(cacheDataHit1[6]/CoreCount)] + [(cacheDataHit1[7]/CoreCount)] + [(cacheDataHit1[8]/CoreCount)] + [(cacheDataHit1[9]/CoreCount)]
-
-            dataWB = dict()
-            dataWB['x'] = WB_line_ds.data['x'] + [x_c] + [x_c+1] + [x_c+2] + [x_c+3] + [x_c+4] + [x_c+5] + [x_c+6] + [x_c+7] + [x_c+8] + [x_c+9]
-            dataWB['y'] = WB_line_ds.data['y'] + [(cacheDataWB1[0]/CoreCount)] + [(cacheDataWB1[1]/CoreCount)] + [(cacheDataWB1[2]/CoreCount)] + [(cacheDataWB1[3]/CoreCount)] + [(cacheDataWB1[4]/CoreCount)] + [(cacheDataWB1[5]/CoreCount)] + [(cacheDataWB1[6]/CoreCount)] + [(cacheDataWB1[7]/CoreCount)] + [(cacheDataWB1[8]/CoreCount)] + [(cacheDataWB1[9]/CoreCount)]
-
-            x_c += 10
-
-            if(final_plot) and not (plot):
-                x_c = 1
-                dataBar['x'] = dataBar['x'][:-final_plot]
-                dataBar['top'] = dataBar['top'][:-final_plot]
-                dataMiss['x'] = dataMiss['x'][:-final_plot]
-                dataMiss['y'] = dataMiss['y'][:-final_plot]
-                dataHit['x'] = dataHit['x'][:-final_plot]
-                dataHit['y'] = dataHit['y'][:-final_plot]
-                dataWB['x'] = dataWB['x'][:-final_plot]
-                dataWB['y'] = dataWB['y'][:-final_plot]
-                final_plot = 0
-
-            else:
-                plot -= 1          
-
-            bar_ds.data = dataBar
-            Miss_line_ds.data = dataMiss
-            Hit_line_ds.data = dataHit
-            WB_line_ds.data = dataWB
-            select_ds.data = dataWB
-
-        if(clear_column):
-            Miss_line_ds.data['x'] = []
-            Miss_line_ds.data['y'] = []
-            Hit_line_ds.data['x'] = []
-            Hit_line_ds.data['y'] = []  
-            WB_line_ds.data['x'] = []
-            WB_line_ds.data['y'] = []           
-            bar_ds.data['x'] = []
-            bar_ds.data['top'] = []
-            clear_column = 0
-
-        if(finished) and (mainQueue.empty()):
-            print(" RENDERING OTHER GRAPHS ")           
-            execution_array = np.roll(execution_array,1)
-            execution_array[0] = maxRow
-            usage_array = np.roll(usage_array, 1)
-            usage_array[0] = round(total/execution_array[0], 3)
+        channelUpdater()        ## before the frames waiting are taken
+        frames = mainQueue.take()       ## the level shown, aggregated once by the shared state
+        if(frames):
+            shown_frame = int(frames[-1]["frame"][0])
+            liveLineUpdater()       ## every frame published since the last tick up to the one shown, from the shared state
+            if(heatmap_view in frames[-1]):     ## not a frame published before the level shown changed
+                heatmapUpdater(frames[-1][heatmap_view])
+            if(detail is not None):
+                detailUpdater()
+            if not (mainQueue.empty()):     ## frames left for the following ticks
+                scheduleUpdate()
+
+
+        if(state.history_version != history_version) or (history_stale):
+            history_version = state.history_version
+            serveHistory()
+
+        if(state.table_version != table_version):
+            table_version = state.table_version
+            execution_array, usage_array = state.table()
             newTable = {'Application' : table_ds.data['Application'],
                     'Execution Time' : execution_array,
                     'Average Utilisation' : usage_array}
             table_ds.data = newTable
+            archive_select.options = archiveOptions()      ## the run just finished was archived
 
-            print("REFRESHING")
-            ####### REFRESHING
-            mainQueue.put(empty, False) ## Add three void data sets to space application runs
-            mainQueue.put(empty, False) 
-            mainQueue.put(empty, False) 
-
-
-            range_tool = RangeTool(x_range = line.x_range)
-            range_tool.overlay.fill_color = "navy"
-            range_tool.overlay.fill_alpha = 0.2
-            if(range_tool_active == 0):
+            if(table_version > 0) and (range_tool_active == 0):     ## a run has finished, its history can be browsed
+                range_tool = RangeTool(x_range = line.x_range)
+                range_tool.overlay.fill_color = "navy"
+                range_tool.overlay.fill_alpha = 0.2
                 select.add_tools(range_tool)
                 select.toolbar.active_multi = range_tool
                 range_tool_active = 1
-            clear = 1
-            total = 0
-            finished = 0
 
 
     else:
         print(" blocking callback function ")
+
+def sessionDestroyed(session_context):
+    state.unsubscribe(session_key)      ## the shared state keeps running for the other sessions
     
 if sys.version_info[0] < 3:
     print("ERROR: Visualiser must be executed using Python 3")
     sys.exit(-1)
 
-# Interrupt handler
-signal.signal(signal.SIGINT, signal_handler)
-
-# Data thread for storing data continuosly
-dataThread = threading.Thread(name='data',target=dataUpdater)
-dataThread.daemon = True
-dataThread.start()
+# Search box pinning lines of the live line
+line_search = TextInput(placeholder = "Pin lines, e.g. 12, 40-43", name = "line_search", width = 200)
+line_search.on_change('value', lineSearch)
+for source in line_sources.values():
+    source.selected.on_change('indices', linePinned)
 
-# Buffer thread for the Queue object
-bufferThread = threading.Thread(name='buffer',target=bufferUpdater)
-bufferThread.daemon = True
-bufferThread.start()
+# Live line drawn with the frames already kept by the shared state
+liveLineUpdater()
 
 # Adding the plots to the current document
 curdoc().add_root(liveLine)
@@ -658,31 +656,45 @@ curdoc().add_root(heatmap)
 curdoc().add_root(bar)
 curdoc().add_root(layout)
 curdoc().add_root(table)
+curdoc().add_root(archive_select)
+curdoc().add_root(detail_layout)
 
 # Button Object
 button = Button(label="Stop/Resume", name = "button", default_size = 150)
 button.on_click(stopper)
 curdoc().add_root(button)
+curdoc().add_root(channel_div)
 
 # Dropdown list for the Heatmap
-menu_h = Dropdown(label = "Select Hierarchy", menu = ["BOX", "BOARD", "MAILBOX", "CORE"], name = "menu_h")
+menu_h = Dropdown(label = "Select Hierarchy", menu = ["BOX", "BOARD", "MAILBOX", "CORE", "THREAD"], name = "menu_h")
 menu_h.on_click(clicker_h)
+heatmap.on_event(events.MouseMove, heatmapHover)
+heatmap.on_event(events.MouseLeave, heatmapLeave)
+heatmap.on_event(events.Tap, heatmapTap)
 curdoc().add_root(menu_h)
 
 # Dropdown list for the Live Line plot
 menu_l = Dropdown(label = "Select Hierarchy", menu = ["BOX", "BOARD", "MAILBOX", "CORE", "THREAD"], name = "menu_l")
 menu_l.on_click(clicker_l)
 curdoc().add_root(menu_l)
+curdoc().add_root(line_search)
 
 curdoc().title = "POETS Dashboard"
 
 # Some system parameters to display on the webpage
 curdoc().template_variables['stats_names'] = [ 'Threads', 'Cores', 'Refresh']
 curdoc().template_variables['stats'] = {
-    'Threads'     : {'icon': None,          'value': 49152,  'label': 'Total Threads'},
-    'Cores'       : {'icon': None,        'value': 3072,  'label': 'Total Cores'},
+    'Threads'     : {'icon': None,          'value': ThreadCount,  'label': 'Total Threads'},
+    'Cores'       : {'icon': None,        'value': CoreCount,  'label': 'Total Cores'},
     'Refresh'        : {'icon': None,        'value': refresh_rate,  'label': 'Refresh Rate (ms)'},
 }
 
-# PlotterUpdater is the callback function for the current document
-curdoc().add_periodic_callback(plotterUpdater, refresh_rate) 
+# Serve the history level matching the selected range whenever it changes
+line.x_range.on_change('start', rangeChanged)
+line.x_range.on_change('end', rangeChanged)
+archive_select.on_change('value', overlayRun)
+
+# PlotterUpdater runs on the next tick whenever the shared state notifies a change, starting with the empty frame
+mainQueue = state.subscribe(session_key, scheduleUpdate, heatmap_view)
+scheduleUpdate()
+curdoc().on_session_destroyed(sessionDestroyed)
@@ -0,0 +1,3 @@
+''' Shared building blocks for the POETS visualiser: the dashboard in parent/ and the senders in the
+    repository root both import from this package.
+'''
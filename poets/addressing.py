@@ -0,0 +1,89 @@
+''' Translation of POETS thread addresses into contiguous thread indices. The bits above the lowest
+    BOARD_SHIFT of an address select the FPGA board, and the boards used by a run aren't contiguous,
+    so every FPGA field is given the next free board index the first time it is seen. Field 0 always
+    stays board 0. Translation is a shift, a mask and a lookup in a small table indexed by the field.
+
+    A fixed mapping can be preloaded from a topology file instead, a JSON object whose "fpga_fields"
+    list gives the FPGA field of every board in board order, e.g. {"fpga_fields": [0, 8, 9, 10]}.
+    Addresses on boards missing from a fixed mapping are invalid, and so are those on boards seen once
+    max_boards were learnt: each such board is reported once per run and its addresses are counted.
+
+    Several translators can share one table, e.g. the receiver processes of the ingest through the
+    shared buffers, so that they all number the boards they learn the same way. Their callers must
+    then serialise translations, since learning writes to the table.
+'''
+import numpy as np
+
+# Address Configurations
+############################################################################
+BOARD_SHIFT = 10                        ## bits of the thread index within a board
+LOCAL_MASK = (1 << BOARD_SHIFT) - 1
+FIELD_BITS = 6                          ## bits of the FPGA field
+MAX_BOARDS = 48                         ## 8 POETS boxes of 6 FPGA boards
+INVALID = -1
+
+
+class AddressTranslator:
+    ''' Maps thread addresses to contiguous indices, learning the board order unless fpga_fields is given. '''
+
+    def __init__(self, fpga_fields=None, max_boards=MAX_BOARDS, table=None):
+        self.max_boards = max_boards
+        self.learn = fpga_fields is None
+        self.preloaded = np.full(1 << FIELD_BITS, INVALID, dtype=np.int64)
+        if self.learn:
+            self.preloaded[0] = 0
+        else:
+            if len(fpga_fields) > max_boards:
+                raise ValueError("topology has " + str(len(fpga_fields)) + " boards, at most " + str(max_boards) + " are supported")
+            for board, field in enumerate(fpga_fields):
+                if not 0 <= field < len(self.preloaded):
+                    raise ValueError("FPGA field " + str(field) + " doesn't fit in " + str(FIELD_BITS) + " bits")
+                self.preloaded[field] = board
+        self.table = np.empty_like(self.preloaded) if table is None else table
+        self.ignored = dict()           ## addresses ignored during the run, by FPGA field learnt too late
+        if table is None or (table == INVALID).all():       ## a shared table is set up by its first translator
+            self.reset()
+
+    @property
+    def boards(self):
+        return int((self.table != INVALID).sum())       ## learnt by any translator sharing the table
+
+    def reset(self):
+        ''' Forgets the learnt boards, at the start of a run. '''
+        self.table[:] = self.preloaded
+        self.ignored.clear()
+
+    def _learn(self, fields):
+        boards = self.boards
+        for field in fields:
+            if boards >= self.max_boards:
+                break
+            self.table[field] = boards
+            boards += 1
+            print(str(boards) + " FPGA boards active")
+
+    def _ignore(self, fields):
+        ''' Counts the addresses of boards found once every board was learnt, reporting each board once. '''
+        for field, count in zip(*np.unique(fields, return_counts=True)):
+            field = int(field)
+            if field not in self.ignored:
+                print("FPGA field " + str(field) + " ignored, " + str(self.max_boards) + " boards already active")
+                self.ignored[field] = 0
+            self.ignored[field] += int(count)
+
+    def translate_many(self, addresses):
+        ''' Indices of an array of addresses, new boards are numbered in order of first appearance. '''
+        addresses = np.asarray(addresses, dtype=np.int64)
+        fields = addresses >> BOARD_SHIFT
+        in_range = fields < len(self.table)
+        fields = np.where(in_range, fields, 0)
+        boards = self.table[fields]
+        if self.learn:
+            unknown = (boards == INVALID) & in_range
+            if unknown.any():
+                new, first = np.unique(fields[unknown], return_index=True)
+                self._learn(new[np.argsort(first)].tolist())
+                boards = self.table[fields]
+                self._ignore(fields[(boards == INVALID) & in_range])
+        indices = (boards << BOARD_SHIFT) | (addresses & LOCAL_MASK)
+        return np.where((boards != INVALID) & in_range, indices, INVALID)
@@ -0,0 +1,58 @@
+''' Hierarchical aggregation of the per-thread TX/s values. The POETS hardware is organised as
+    thread -> core -> mailbox -> board -> box, and every view of the dashboard shows the mean of the
+    threads contained in one element of the selected level. All levels are computed once per tick
+    with NumPy reductions, each level being reduced from the one below it. The sums of every level
+    are kept between ticks, so that a tick in which only some cores changed recomputes only those
+    cores and the mailboxes, boards and boxes containing them.
+'''
+import numpy as np
+from poets.topology import LEVELS
+
+
+def active_count(biggest, level, sizes):
+    ''' Number of elements of a level that contain at least one thread up to index biggest. '''
+    return -(-(biggest + 1) // sizes[level])
+
+
+class HierarchyAggregator:
+    ''' Computes the mean TX/s of every element of every hierarchy level of a topology from a
+        ThreadLevel array. Results are stored in self.levels and only cover the elements up to the
+        biggest active thread, like the views did before. They are views of arrays updated in place
+        by the next update.
+    '''
+
+    def __init__(self, topology):
+        sizes = topology.sizes
+        box = sizes[LEVELS[-1]]
+        thread_count = topology.thread_count
+        self.thread_count = thread_count
+        self.sizes = sizes
+        self.parent = topology.parent       ## element of the level above containing every element
+        self.padded_count = -(-thread_count // box) * box    ## reshapes need whole boxes
+        self._sums = {level : np.zeros(self.padded_count // sizes[level], dtype=np.int64) for level in LEVELS}
+        self._means = {level : np.zeros(self.padded_count // sizes[level], dtype=np.int64) for level in LEVELS}
+        self._means["THREAD"] = self._sums["THREAD"]        ## a thread is its own mean
+        self.levels = {level: np.zeros(0, dtype=np.int64) for level in LEVELS}
+
+    def update_cores(self, thread_level, biggest, cores):
+        ''' Recomputes only the elements containing the given cores, whose threads are read from
+            thread_level, biggest being the highest thread index seen. Returns the levels and, for
+            every level, the elements recomputed.
+        '''
+        per_core = self.sizes["CORE"]
+        elements = (np.asarray(cores)[:, None] * per_core + np.arange(per_core)).ravel()       ## threads of the cores
+        self._sums["THREAD"][elements] = thread_level[elements]
+        touched = {"THREAD" : elements}
+        for lower, upper in zip(LEVELS, LEVELS[1:]):
+            factor = self.sizes[upper] // self.sizes[lower]
+            elements = np.unique(self.parent[lower][elements])
+            self._sums[upper][elements] = self._sums[lower].reshape(-1, factor)[elements].sum(axis=1)
+            self._means[upper][elements] = self._sums[upper][elements] // self.sizes[upper]
+            touched[upper] = elements
+        return self._views(biggest), touched
+
+    def _views(self, biggest):
+        biggest = min(biggest, self.thread_count - 1)
+        for level in LEVELS:
+            self.levels[level] = self._means[level][:active_count(biggest, level, self.sizes)]
+        return self.levels
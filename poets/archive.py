@@ -0,0 +1,104 @@
+''' Archive of finished runs, so that any past run can be listed, compared and shown again without
+    replaying it. An archive is a directory holding
+      - catalog.sqlite: one row per run with its summary statistics, indexed by finish time
+      - <run id>/<column>.npy: the per-second series of the run, one plain .npy file per column
+    The series are opened with np.load(mmap_mode="r") like the run store, so loading a run to overlay
+    it only maps a few small files. A run's row is committed after its series are written, readers
+    never see a run whose files are missing.
+
+    Usage: python -m poets.archive runs/archive      lists the archived runs
+'''
+import argparse
+import contextlib
+import os
+import sqlite3
+import time
+import warnings
+import numpy as np
+
+# Archive Configurations
+############################################################################
+CATALOG_FILE = "catalog.sqlite"
+SERIES = ("second", "miss", "hit", "wb", "idle")        ## columns of every run, one value per second
+## Summary columns of the catalog, filled from RunStats.summary and the means of the series
+SUMMARY = [("seconds", "INTEGER"), ("frames", "INTEGER"), ("utilisation", "REAL"),
+           ("frame_low", "INTEGER"), ("frame_high", "INTEGER"), ("frame_mean", "REAL"),
+           ("p50", "INTEGER"), ("p95", "INTEGER"), ("p99", "INTEGER"),
+           ("mean_miss", "REAL"), ("mean_hit", "REAL"), ("mean_wb", "REAL"), ("mean_idle", "REAL")]
+
+
+class RunArchive:
+    ''' Archive at path, created if missing. A connection is opened for every call, so one archive
+        can be used from the updater thread and from the sessions at the same time.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        columns = ", ".join(name + " " + kind for name, kind in SUMMARY)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, finished REAL, " + columns + ")")
+            db.execute("CREATE INDEX IF NOT EXISTS runs_finished ON runs (finished)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(os.path.join(self.path, CATALOG_FILE), timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:            ## commits, or rolls back on an exception
+                yield db
+        finally:
+            db.close()
+
+    def add(self, summary, series):
+        ''' Archives a run: summary is a dict of SUMMARY values, missing ones being computed from the
+            series, series a dict of equally long arrays for every SERIES column. Returns the run id.
+        '''
+        row = dict(summary)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)         ## a series of empty seconds has no mean
+            for name in SERIES[1:]:
+                values = np.asarray(series[name], dtype=np.float64)
+                row.setdefault("mean_" + name, float(np.nanmean(values)) if len(values) else None)
+        names = [name for name, _ in SUMMARY]
+        with self._connect() as db:
+            cursor = db.execute("INSERT INTO runs (finished, " + ", ".join(names) + ") VALUES (?" + ", ?" * len(names) + ")",
+                                [time.time()] + [row.get(name) for name in names])
+            run_id = cursor.lastrowid
+            directory = os.path.join(self.path, str(run_id))
+            os.makedirs(directory, exist_ok=True)
+            for name in SERIES:
+                np.save(os.path.join(directory, name + ".npy"), np.asarray(series[name], dtype=np.float64))
+        return run_id
+
+    def runs(self, limit=None):
+        ''' Catalog rows as dicts, newest first. '''
+        query = "SELECT * FROM runs ORDER BY id DESC"
+        with self._connect() as db:
+            if limit is not None:
+                return [dict(row) for row in db.execute(query + " LIMIT ?", (limit,))]
+            return [dict(row) for row in db.execute(query)]
+
+    def run(self, run_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def series(self, run_id):
+        ''' Per-second series of a run, as views of the mapped files. '''
+        directory = os.path.join(self.path, str(run_id))
+        return {name : np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in SERIES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the runs of a run archive")
+    parser.add_argument("archive", help="archive directory")
+    parser.add_argument("--limit", type=int, default=None, help="newest runs only")
+    args = parser.parse_args()
+    for run in RunArchive(args.archive).runs(args.limit):
+        print(str(run["id"]) + "  " + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run["finished"])) +
+              "  " + str(run["seconds"]) + " s  " + str(run["utilisation"]) + " TX/s  p95 " + str(run["p95"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+''' Headless benchmark of the ingest and aggregation path, without a Bokeh server or a browser.
+    A recorded run store, or a synthetic run of up to 49152 threads, is fed as fast as possible
+    either in-process, straight into an Ingestor, or over loopback UDP to the receiver the dashboard
+    uses. After every second of the run, once the receiver applied it, the shared state is updated
+    exactly as the server does, and the time taken by each of these ticks is recorded. The report is a
+    single JSON object: packets (thread samples, one per datagram in the text format) and datagrams
+    per second, packets lost, tick latency percentiles, the frame channel metrics of every session and
+    peak memory, of the benchmark and of the receiver processes.
+
+    Usage: python -m poets.bench --threads 49152 --seconds 30
+           python -m poets.bench --store runs/visualiser_data --transport udp --output bench.json
+'''
+import argparse
+import contextlib
+import json
+import resource
+import socket
+import sys
+import time
+import numpy as np
+from poets import protocol
+from poets.ingest import DROPPED, PACKETS, Ingestor, finish_run
+from poets.live import LiveState
+from poets.runstore import RunStore, wire_records
+from poets.topology import Topology
+
+# Benchmark Configurations
+############################################################################
+BENCH_ADDR = ("::1", 5099)      ## loopback port, away from the dashboard's
+DRAIN_TIMEOUT = 2.0             ## seconds without a new sample after which the UDP receiver is considered drained
+TICK_TIMEOUT = 0.2              ## same before a tick, the samples still missing then are taken as lost
+
+
+def synthetic_run(threads, seconds, seed=0):
+    ''' Seconds of a run in which every thread reports every second, as (cIDX, RECORD array) pairs.
+        Threads are numbered board after board, the way the hardware addresses them.
+    '''
+    rng = np.random.default_rng(seed)
+    addresses = np.arange(threads)          ## board b has FPGA field b, learnt in order like the hardware's
+    base = rng.integers(0, 1000, threads)
+    for cidx in range(seconds):
+        records = np.zeros(threads, dtype=protocol.RECORD)
+        records['thread_id'] = addresses
+        records['cidx'] = cidx
+        records['tx_per_s'] = base + rng.integers(0, 100, threads)     ## every tick changes some values
+        records['cache_miss'] = rng.integers(0, 2000, threads)
+        records['cache_hit'] = rng.integers(0, 200000, threads)
+        records['cache_wb'] = rng.integers(0, 1000, threads)
+        records['cpu_idle'] = rng.integers(0, 2100000, threads)
+        yield cidx, records
+
+
+def store_run(path):
+    for cidx, rows in RunStore(path).seconds():
+        yield cidx, wire_records(rows)
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    values = np.asarray(values) * 1000
+    return {"mean" : float(values.mean()), "p50" : float(np.percentile(values, 50)),
+            "p95" : float(np.percentile(values, 95)), "max" : float(values.max())}
+
+
+def _tick(state, latencies):
+    start = time.perf_counter()
+    state.update()
+    latencies.append(time.perf_counter() - start)
+    for frames, _, _ in list(state.subscribers.values()):      ## sessions take what was published
+        frames.take()
+
+
+def _finish(state):
+    finish_run(state.buffers)
+    while state.update():       ## the rest of the history and the table row
+        pass
+
+
+def _wait_drained(buffers, expected, timeout=DRAIN_TIMEOUT):
+    ''' Waits until the receiver applied expected samples or made no progress for timeout seconds. '''
+    last, last_change = -1, time.monotonic()
+    while True:
+        applied = int(buffers.meta[PACKETS])
+        if applied >= expected:
+            return
+        if applied != last:
+            last, last_change = applied, time.monotonic()
+        elif time.monotonic() - last_change > timeout:
+            return
+        time.sleep(0.01)
+
+
+def run_benchmark(seconds_source, topology, transport="inprocess", ingest_mode="thread", workers=1,
+                  sessions=1, addr=BENCH_ADDR):
+    ''' Feeds the (cIDX, RECORD array) pairs of seconds_source and returns the report as a dict. '''
+    mode = "external" if transport == "inprocess" else ingest_mode
+    state = LiveState(topology, addr=addr, mode=mode, workers=workers, refresh=None)
+    for i in range(sessions):
+        state.subscribe(i)
+    ingestor = Ingestor(state.buffers, topology.fpga_fields) if transport == "inprocess" else None
+    sock = None
+    if transport == "udp":
+        sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        time.sleep(0.5)         ## receivers bind their socket
+
+    latencies, samples, datagrams, elapsed = [], 0, 0, 0.0
+    try:
+        for cidx, records in seconds_source:
+            start = time.perf_counter()         ## reading or generating the second isn't timed
+            samples += len(records)
+            if ingestor is not None:
+                with state.buffers.writing():
+                    ingestor.apply(records)
+            else:
+                for message in protocol.pack(records):
+                    sock.sendto(message, addr)
+                    datagrams += 1
+                _wait_drained(state.buffers, samples, TICK_TIMEOUT)     ## the tick aggregates the second just sent
+            _tick(state, latencies)
+            elapsed += time.perf_counter() - start
+        if sock is not None:
+            start = time.perf_counter()
+            _wait_drained(state.buffers, samples)
+            elapsed += time.perf_counter() - start
+        applied = int(state.buffers.meta[PACKETS])
+        dropped = int(state.buffers.meta[DROPPED])
+        _finish(state)
+        channels = state.metrics()
+    finally:
+        if sock is not None:
+            sock.close()
+        state.stop()
+
+    return {"transport" : transport,
+            "ingest_mode" : mode,
+            "threads" : topology.thread_count,
+            "sessions" : sessions,
+            "seconds" : len(latencies),
+            "packets" : samples,
+            "datagrams" : datagrams if sock is not None else None,
+            "elapsed_s" : elapsed,
+            "packets_per_s" : applied / elapsed if elapsed else None,
+            "datagrams_per_s" : datagrams / elapsed if sock is not None and elapsed else None,
+            "packets_applied" : applied,
+            "packets_lost" : samples - applied,
+            "loss" : (samples - applied) / samples if samples else 0.0,
+            "kernel_drops" : dropped,
+            "tick_ms" : _percentiles(latencies),
+            "channels" : {str(key) : stats for key, stats in channels.items()},     ## depth and drops of every session
+            "peak_rss_bytes" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,    ## kilobytes on Linux
+            ## largest receiver process, they were joined when the state stopped
+            "peak_child_rss_bytes" : resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingest and aggregation path of the dashboard")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--store", help="run store to replay, see poets.runstore")
+    source.add_argument("--threads", type=int, default=49152, help="threads of the synthetic run")
+    parser.add_argument("--seconds", type=int, default=20, help="seconds of the synthetic run")
+    parser.add_argument("--transport", choices=["inprocess", "udp"], default="inprocess")
+    parser.add_argument("--ingest-mode", choices=["thread", "process"], default="thread", help="receiver used over UDP")
+    parser.add_argument("--workers", type=int, default=1, help="receiver processes in process mode")
+    parser.add_argument("--sessions", type=int, default=1, help="subscribed sessions, each gets a copy of the CORE level of every frame")
+    parser.add_argument("--topology", help="topology file, see poets.topology")
+    parser.add_argument("--output", help="file to write the JSON report to, otherwise stdout")
+    args = parser.parse_args()
+
+    if args.topology:
+        topology = Topology.load(args.topology)
+    elif args.store:
+        topology = Topology()
+    else:
+        topology = Topology(boxes=-(-args.threads // Topology().sizes["BOX"]))
+    seconds = store_run(args.store) if args.store else synthetic_run(min(args.threads, topology.thread_count), args.seconds)
+
+    with contextlib.redirect_stdout(sys.stderr):       ## status messages of the state stay out of the report
+        report = run_benchmark(seconds, topology, args.transport, args.ingest_mode, args.workers, args.sessions)
+    report["source"] = args.store or "synthetic"
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+''' Bounded channel carrying the aggregated frames from the shared state to one session. A frame is a
+    dict of arrays for some of the channel's keys, e.g. the level a session shows; put copies it into
+    one of a fixed set of preallocated slots, so the producer never shares an array with the consumer
+    and memory doesn't grow when a browser lags. Taken frames hold the keys that were put only.
+    The consumer owns the slots returned by take until its next take, the producer fills the others:
+    with one pending frame this is a double buffer.
+
+    When every slot is pending the oldest pending frame is dropped. The policy decides what take
+    returns:
+        "latest"    only the newest frame, older pending ones are coalesced into it (one pending slot)
+        "oldest"    the oldest pending frame, one per take, the others wait for the following takes
+        "keep"      every pending frame, so that the consumer catches up in one go
+'''
+import collections
+import threading
+import numpy as np
+
+# Channel Configurations
+############################################################################
+POLICIES = ("latest", "oldest", "keep")
+
+
+class SnapshotChannel:
+    ''' Frames of lengths[key] elements at most for every key, capacity of them pending at most.
+        dtype is the dtype of every key, or a dict of them.
+    '''
+
+    def __init__(self, lengths, dtype=np.int64, capacity=1, policy="latest"):
+        if policy not in POLICIES:
+            raise ValueError("unknown policy " + str(policy) + ", expected one of " + ", ".join(POLICIES))
+        if policy == "latest":
+            capacity = 1
+        self.policy = policy
+        self.capacity = max(1, capacity)
+        held = self.capacity if policy == "keep" else 1     ## slots the consumer may own at once
+        dtypes = dtype if isinstance(dtype, dict) else dict.fromkeys(lengths, dtype)
+        self._slots = [{key : np.zeros(length, dtype=dtypes[key]) for key, length in lengths.items()}
+                       for _ in range(self.capacity + held)]
+        self._sizes = [dict() for _ in self._slots]     ## elements of every key put in each slot
+        self._free = collections.deque(range(len(self._slots)))
+        self._pending = collections.deque()
+        self._held = []
+        self._lock = threading.Lock()
+
+        self.put_count = 0          ## frames offered by the producer
+        self.dropped = 0            ## frames dropped or coalesced before being taken
+        self.max_depth = 0          ## highest number of pending frames seen
+
+    def put(self, frame):
+        ''' Copies frame into a free slot, dropping the oldest pending frame if none is left. '''
+        with self._lock:
+            if not self._free or len(self._pending) >= self.capacity:
+                self._free.append(self._pending.popleft())
+                self.dropped += 1
+            slot = self._free.popleft()
+            self._sizes[slot] = dict()
+            for key, values in frame.items():
+                n = min(len(values), len(self._slots[slot][key]))
+                self._slots[slot][key][:n] = values[:n]
+                self._sizes[slot][key] = n
+            self._pending.append(slot)
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self._pending))
+
+    def take(self):
+        ''' Frames to render now according to the policy, oldest first, possibly none. They stay valid
+            until the next take.
+        '''
+        with self._lock:
+            self._free.extend(self._held)
+            if self.policy == "oldest":
+                self._held = [self._pending.popleft()] if self._pending else []
+            else:
+                self._held = list(self._pending)
+                self._pending.clear()
+            return [{key : self._slots[slot][key][:size] for key, size in self._sizes[slot].items()}
+                    for slot in self._held]
+
+    def empty(self):
+        return not self._pending
+
+    @property
+    def depth(self):
+        ''' Number of frames waiting to be taken. '''
+        return len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            return {"depth" : len(self._pending), "max_depth" : self.max_depth, "capacity" : self.capacity,
+                    "put" : self.put_count, "dropped" : self.dropped, "policy" : self.policy}
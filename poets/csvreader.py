@@ -0,0 +1,214 @@
+''' Streaming reader of instrumentation CSV files. Instead of loading a whole file with np.loadtxt,
+    the file is read in blocks of CHUNK_BYTES, every block is cut at its last complete line and parsed
+    by np.loadtxt into a RUN_RECORD array, and the chunks are regrouped into time slices. The stages
+    are chained generators, so a replay can start as soon as the first cIDX is complete and memory
+    stays bounded to one block plus the slice being assembled.
+
+    The file is expected to be written one cIDX after the other, as the instrumentation CSV is; a
+    slice ends wherever the cIDX changes.
+
+    A directory of instrumentation_thread_<id>.csv files, one per thread, is read by a k-way merge on
+    cIDX instead: each file keeps a cursor, a heap orders the files by the cIDX of their next line, and
+    the lines of the smallest cIDX are taken from every file that has them. Each file is read ahead
+    READ_AHEAD bytes at a time by a bounded thread pool, so most slices are served from memory; the
+    OPEN_FILES most recently read files stay open and the others are reopened at their offset.
+'''
+import collections
+import glob
+import heapq
+import io
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from poets import protocol
+
+# Reader Configurations
+############################################################################
+CHUNK_BYTES = 16 * 1024 * 1024      ## bytes read and parsed at once, about 150k rows
+MERGE_WORKERS = 16                  ## threads reading per-thread files
+READ_AHEAD = 4096                   ## bytes read from a per-thread file at each visit, about 25 lines
+OPEN_FILES = 1024                   ## per-thread files kept open between visits, the rest are reopened
+THREAD_FILE_PATTERN = "instrumentation_thread_*.csv"
+
+## A wire record followed by the Time column, the prefix can be sent as is with protocol.pack
+RUN_RECORD = np.dtype(protocol.RECORD.descr + [("time", "<f8")])
+RUN_COLUMNS = protocol.CSV_COLUMNS + (2,)     ## CSV columns of a RUN_RECORD, in order
+
+
+def is_data(line):
+    ''' False for the header and blank lines. '''
+    line = line.strip()
+    return bool(line) and not line[:1].isalpha()
+
+
+def parse(text):
+    ''' Parses CSV text, or a list of CSV lines, into a RUN_RECORD array. '''
+    if isinstance(text, str):
+        text = io.StringIO(text)
+    rows = np.loadtxt(text, delimiter=",", usecols=RUN_COLUMNS, ndmin=2)
+    records = np.empty(len(rows), dtype=RUN_RECORD)
+    for i, name in enumerate(RUN_RECORD.names):
+        records[name] = rows[:, i]
+    return records
+
+
+def count_rows(path):
+    with open(path) as csv_file:
+        return sum(1 for line in csv_file if is_data(line))
+
+
+def read_chunks(path, chunk_bytes=CHUNK_BYTES):
+    ''' Yields the rows of a CSV file as RUN_RECORD arrays of roughly chunk_bytes of text each. '''
+    with open(path, "rb") as csv_file:
+        first = csv_file.readline()
+        rest = first if is_data(first.decode("utf-8")) else b""     ## drop the header
+        while True:
+            block = csv_file.read(chunk_bytes)
+            if not block:
+                break
+            block = rest + block
+            end = block.rfind(b"\n") + 1           ## parse complete lines only, keep the rest for the next block
+            rest = block[end:]
+            if end:
+                records = parse(block[:end].decode("utf-8"))
+                if len(records):
+                    yield records
+        if rest.strip():
+            yield parse(rest.decode("utf-8"))
+
+
+def time_slices(chunks):
+    ''' Regroups chunks of records into one array per cIDX, yielding each slice once it is complete. '''
+    pending = []            ## parts of the slice being assembled
+    for chunk in chunks:
+        bounds = np.flatnonzero(np.diff(chunk['cidx'])) + 1     ## rows where a new time instance starts
+        parts = np.split(chunk, bounds)
+        if pending and pending[0]['cidx'][0] != parts[0]['cidx'][0]:
+            yield np.concatenate(pending)
+            pending = []
+        pending.append(parts[0])
+        for part in parts[1:]:
+            yield np.concatenate(pending)
+            pending = [part]
+    if pending:
+        yield np.concatenate(pending)
+
+
+def stream_slices(path, chunk_bytes=CHUNK_BYTES):
+    ''' Time slices of a CSV file, read lazily. '''
+    return time_slices(read_chunks(path, chunk_bytes))
+
+
+# Per-thread files
+############################################################################
+class _FileCursor:
+    ''' Position in a per-thread file, and the lines read ahead of it. '''
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None      ## open file, None while closed or once exhausted
+        self.offset = 0         ## where the next block starts
+        self.lines = collections.deque()    ## (cidx, line) read ahead, oldest first
+        self.rest = b""         ## incomplete line at the end of the last block
+        self.eof = False
+
+    @property
+    def cidx(self):
+        ''' cIDX of the next line, None once the file is exhausted. '''
+        return self.lines[0][0] if self.lines else None
+
+    def fill(self, read_ahead):
+        ''' Reads the next block of lines, reopening the file where it was left if it was closed. '''
+        if self.handle is None:
+            self.handle = open(self.path, "rb")
+            self.handle.seek(self.offset)
+        block = self.handle.read(read_ahead)
+        self.offset += len(block)
+        text = self.rest + block
+        if len(block) == read_ahead:
+            end = text.rfind(b"\n") + 1
+            text, self.rest = text[:end], text[end:]
+        else:                   ## a short block is the end of the file, no need to come back
+            self.rest = b""
+            self.eof = True
+            self.close()
+        for line in text.splitlines(keepends=True):
+            if is_data(line.decode("utf-8")):
+                self.lines.append((int(line.split(b",", 2)[1]), line if line.endswith(b"\n") else line + b"\n"))
+        return self
+
+    def take(self, cidx):
+        ''' Read ahead lines of cidx, there may be more in the file if the read ahead ran out. '''
+        lines = []
+        while self.lines and self.lines[0][0] == cidx:
+            lines.append(self.lines.popleft()[1])
+        return lines
+
+    def hungry(self):
+        ''' True while the next line has to be read from the file. '''
+        return not self.lines and not self.eof
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+
+def thread_files(directory):
+    ''' Per-thread files of a directory, ordered by thread id. '''
+    def thread_id(path):
+        match = re.search(r"(\d+)\.csv$", path)
+        return int(match.group(1)) if match else -1
+    return sorted(glob.glob(os.path.join(directory, THREAD_FILE_PATTERN)), key=thread_id)
+
+
+def merge_thread_files(directory, workers=MERGE_WORKERS, read_ahead=READ_AHEAD, open_files=OPEN_FILES):
+    ''' Time slices of a directory of per-thread files, read lazily. Every slice holds the samples
+        of one cIDX from all the files, in thread id order.
+    '''
+    paths = thread_files(directory)
+    if not paths:
+        raise FileNotFoundError("no " + THREAD_FILE_PATTERN + " files in " + directory)
+    cursors = [_FileCursor(path) for path in paths]
+    opened = collections.OrderedDict()      ## cursors holding a handle, least recently read first
+
+    def fill(pool, hungry):
+        ''' Reads a block of every hungry cursor, keeping at most open_files handles between reads. '''
+        for start in range(0, len(hungry), open_files):
+            batch = [cursors[i] for i in hungry[start:start + open_files]]
+            for cursor in pool.map(lambda cursor: cursor.fill(read_ahead), batch):
+                opened.pop(cursor.path, None)
+                if cursor.handle is not None:
+                    opened[cursor.path] = cursor
+            while len(opened) > open_files:
+                opened.popitem(last=False)[1].close()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            hungry = list(range(len(cursors)))
+            while hungry:       ## a file may start with more than a block of header and blank lines
+                fill(pool, hungry)
+                hungry = [i for i in hungry if cursors[i].hungry()]
+            heap = [(cursor.cidx, i) for i, cursor in enumerate(cursors) if cursor.lines]
+            heapq.heapify(heap)
+            while heap:
+                cidx = heap[0][0]
+                due = []
+                while heap and heap[0][0] == cidx:
+                    due.append(heapq.heappop(heap)[1])
+                due.sort()      ## file order, so the slice is in thread id order
+                taken = {i : [] for i in due}
+                hungry = due
+                while hungry:   ## only files whose read ahead ran out are read, the rest is in memory
+                    for i in hungry:
+                        taken[i] += cursors[i].take(cidx)
+                    hungry = [i for i in hungry if cursors[i].hungry()]
+                    fill(pool, hungry)
+                for i in due:
+                    if cursors[i].lines:
+                        heapq.heappush(heap, (cursors[i].cidx, i))
+                yield parse(b"".join(line for i in due for line in taken[i]).decode("utf-8"))
+    finally:
+        for cursor in opened.values():
+            cursor.close()
@@ -0,0 +1,493 @@
+''' Packet ingest for the dashboard. The ingest loop receives datagrams, decodes them and writes the
+    results into an IngestBuffers object: the latest TX/s of every thread and, for every core, the
+    counters reported by its thread 0 during each of the last SLOTS seconds. The renderer never
+    touches the live buffers, it only reads consistent snapshots of them.
+
+    The loop runs either as a thread of the Bokeh server ("thread" mode) or in one or more receiver
+    processes ("process" mode). A recorded run store can also be replayed straight into the buffers
+    without going through a socket ("store" mode). In "asyncio" mode there is no loop of its own,
+    an IngestProtocol receives the datagrams on the server's event loop, and in "external" mode the
+    caller writes the buffers itself with an Ingestor. In process mode the buffers live in multiprocessing.shared_memory so
+    that packet parsing doesn't compete with document rendering for the GIL. In both modes writers
+    serialise on a lock and publish through a seqlock: the sequence number is odd while a batch is
+    being written, and a reader retries its copy if the number was odd or changed while copying.
+
+    Writers also record which cores changed: every batch is numbered and stamps the cores it wrote,
+    so a reader finds the cores written since its previous snapshot by comparing stamps with the
+    batch number it last saw, without writing to the buffers itself.
+'''
+import asyncio
+import atexit
+import contextlib
+import multiprocessing
+import signal
+import socket
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from poets import protocol
+from poets.addressing import BOARD_SHIFT, FIELD_BITS, INVALID, AddressTranslator
+from poets.receiver import RCVBUF_SIZE, BulkReceiver
+from poets.runstore import RunStore, wire_records
+
+# Ingest Configurations
+############################################################################
+SLOTS = 128                 ## seconds of per-core counters kept for the renderer to consume, more than a
+                            ## replay at 100x sends between two updates of the shared state
+METRICS = ["blocked", "cache_miss", "cache_hit", "cache_wb", "cpu_idle", "reported"]
+COPY_RETRIES = 50           ## torn snapshot copies before a reader takes the writers' lock
+END_OF_RUN_TIMEOUT = 7      ## seconds without packets after which a run is considered finished
+STOP_TIMEOUT = 2            ## seconds stop_ingest waits for an ingest thread, a replay checks once per second
+FLUSH_DELAY = 0.002         ## seconds the asyncio ingest collects datagrams before writing them as one batch
+disconnect_msg = "DISCONNECT"
+
+## Indices of the meta array
+SEQ, BIGGEST, MAX_CIDX, ENTERED, RUN_ID, RUNS_FINISHED, PACKETS, DROPPED, LAST_PACKET, BATCHES = range(10)
+META_SIZE = 16
+
+
+class IngestBuffers:
+    ''' Arrays shared between the ingest and the renderer, laid out in a single memory block.
+        With shared=True the block is a SharedMemory segment that receiver processes attach to by
+        name, otherwise it is ordinary memory; snapshots are plain IngestBuffers as well.
+    '''
+
+    def __init__(self, thread_count, core_count, shared=False, name=None, lock=None):
+        self.thread_count = thread_count
+        self.core_count = core_count
+        layout = [("meta", np.int64, (META_SIZE,)),
+                  ("slot_cidx", np.int64, (SLOTS,)),            ## cIDX currently held by each slot
+                  ("core_seconds", np.uint32, (SLOTS, core_count, len(METRICS))),
+                  ("core_stamp", np.int64, (core_count,)),      ## latest batch that wrote a thread of each core
+                  ("boards", np.int64, (1 << FIELD_BITS,)),     ## board of every FPGA field, shared by the workers
+                  ("thread_level", np.uint16, (thread_count,))]
+        size = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, dtype, shape in layout)
+
+        if shared:
+            self._shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+            buf = self._shm.buf
+        else:
+            self._shm = None
+            buf = bytearray(size)
+        offset = 0
+        for field, dtype, shape in layout:
+            array = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+            setattr(self, field, array)
+            offset += array.nbytes
+
+        if name is None:            ## a new block, not one attached by a receiver process
+            self.meta[:] = 0
+            self.meta[BIGGEST] = 1
+            self.meta[MAX_CIDX] = -1
+            self.slot_cidx[:] = -1
+            self.core_seconds[:] = 0
+            self.core_stamp[:] = 0
+            self.boards[:] = INVALID      ## set up by the first Ingestor
+            self.thread_level[:] = 0
+        if lock is None:
+            lock = multiprocessing.Lock() if shared else threading.Lock()
+        self.lock = lock
+
+    def __getstate__(self):
+        ## Receiver processes attach to the same segment by name instead of copying the arrays
+        if self._shm is None:
+            raise TypeError("only shared IngestBuffers can be sent to another process")
+        return (self.thread_count, self.core_count, self._shm.name, self.lock)
+
+    def __setstate__(self, state):
+        thread_count, core_count, name, lock = state
+        self.__init__(thread_count, core_count, shared=True, name=name, lock=lock)
+
+    def close(self, unlink=False):
+        if self._shm is not None:
+            for field in ("meta", "slot_cidx", "core_seconds", "core_stamp", "boards", "thread_level"):
+                delattr(self, field)     ## views must go before the segment can be closed
+            self._shm.close()
+            if unlink:
+                self._shm.unlink()
+            self._shm = None
+
+    @contextlib.contextmanager
+    def writing(self):
+        ''' Write section of the seqlock, only one writer at a time. '''
+        with self.lock:
+            self.meta[SEQ] += 1
+            try:
+                yield self
+            finally:
+                self.meta[SEQ] += 1
+
+    def copy_to(self, out, since=0):
+        ''' Copies a consistent snapshot into out, another IngestBuffers. Only the slots of the seconds
+            from since to max_cidx are copied, the others are left as they were in out. After
+            COPY_RETRIES attempts torn by writers, the copy is made under the writers' lock instead.
+        '''
+        for _ in range(COPY_RETRIES):
+            seq = int(self.meta[SEQ])
+            if seq & 1:
+                time.sleep(0.0005)      ## a batch is being written
+                continue
+            self._copy(out, since)
+            if int(self.meta[SEQ]) == seq:
+                return out
+        with self.lock:
+            return self._copy(out, since)
+
+    def _copy(self, out, since):
+        np.copyto(out.meta, self.meta)
+        np.copyto(out.slot_cidx, self.slot_cidx)
+        max_cidx = int(out.meta[MAX_CIDX])
+        slots = np.arange(max(since, max_cidx - SLOTS + 1), max_cidx + 1) % SLOTS
+        out.core_seconds[slots] = self.core_seconds[slots]
+        np.copyto(out.core_stamp, self.core_stamp)
+        np.copyto(out.thread_level, self.thread_level)
+        return out
+
+    def snapshot(self):
+        return self.copy_to(IngestBuffers(self.thread_count, self.core_count))
+
+    @property
+    def biggest(self):
+        return int(self.meta[BIGGEST])
+
+    @property
+    def max_cidx(self):
+        return int(self.meta[MAX_CIDX])
+
+    @property
+    def entered(self):
+        return bool(self.meta[ENTERED])
+
+    @property
+    def batches(self):
+        return int(self.meta[BATCHES])
+
+    def dirty_cores(self, since):
+        ''' Cores written by a batch after batch number since. '''
+        return np.flatnonzero(self.core_stamp > since)
+
+    @property
+    def run_id(self):
+        return int(self.meta[RUN_ID])
+
+    @property
+    def runs_finished(self):
+        return int(self.meta[RUNS_FINISHED])
+
+    def second(self, cidx):
+        ''' Per-core counters (core_count x METRICS) of second cidx, or None once its slot was reused. '''
+        slot = cidx % SLOTS
+        if self.slot_cidx[slot] != cidx:
+            return None
+        return self.core_seconds[slot]
+
+
+class Ingestor:
+    ''' Writes decoded records into IngestBuffers. Every writer has its own Ingestor, whose address
+        translation uses the board table of the buffers, so that the boards learnt by any writer get
+        the same index in all of them.
+    '''
+
+    def __init__(self, buffers, fpga_fields=None):
+        self.buffers = buffers
+        with buffers.lock:      ## the first writer sets the table up
+            self.translator = AddressTranslator(fpga_fields, max_boards=buffers.thread_count >> BOARD_SHIFT,
+                                                table=buffers.boards)   ## fixed board order if given, learnt otherwise
+
+    def start_run(self):
+        ''' First packet after the end of a run: forget the previous run's seconds and addresses. '''
+        b = self.buffers
+        b.meta[ENTERED] = 1
+        b.meta[RUN_ID] += 1
+        b.meta[MAX_CIDX] = -1
+        b.slot_cidx[:] = -1
+        self.translator.reset()
+
+    def apply(self, records):
+        ''' Writes a RECORD array, must be called inside buffers.writing(). '''
+        b = self.buffers
+        if not len(records):
+            return
+        if not b.meta[ENTERED]:
+            self.start_run()
+        b.meta[PACKETS] += len(records)
+        b.meta[LAST_PACKET] = int(time.monotonic() * 1000)     ## system-wide clock, comparable between workers
+
+        ids = self.translator.translate_many(records['thread_id'])     ## contiguous thread indices, -1 if unknown
+        b.meta[BIGGEST] = max(b.meta[BIGGEST], ids.max())
+        valid = (ids >= 0) & (ids < b.thread_count)
+        if not valid.all():
+            print("idx range is out of bound")
+        b.thread_level[ids[valid]] = records['tx_per_s'][valid].astype(np.int64)
+        per_core = b.thread_count // b.core_count
+        b.meta[BATCHES] += 1
+        b.core_stamp[ids[valid] // per_core] = b.meta[BATCHES]
+
+        ## Take only Thread 0 of each core as a representative of the entire core counter
+        rows = valid & (ids % per_core == 0)
+        if not rows.any():
+            return
+        cores = ids[rows] // per_core
+        cidx = records['cidx'][rows].astype(np.int64)
+        b.meta[MAX_CIDX] = max(b.meta[MAX_CIDX], cidx.max())
+
+        for second in np.unique(cidx).tolist():        ## claim the slot of every new second
+            slot = second % SLOTS
+            if b.slot_cidx[slot] < second:
+                b.core_seconds[slot] = 0
+                b.slot_cidx[slot] = second
+        slots = cidx % SLOTS
+        keep = b.slot_cidx[slots] == cidx              ## samples older than their slot arrived too late
+        values = np.stack([records[name][rows] for name in METRICS[:-1]] + [np.ones(len(cores), dtype=np.uint32)], axis=1)
+        b.core_seconds[slots[keep], cores[keep]] = values[keep]
+
+
+# Ingest loop
+############################################################################
+def open_socket(addr, reuse_port=False):
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM, socket.IPPROTO_IP) ## Create UDP socket
+    sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, False)
+    if reuse_port:      ## several receiver processes share the port, the kernel spreads the senders among them
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(addr)
+    sock.settimeout(END_OF_RUN_TIMEOUT)
+    return sock
+
+
+def finish_run(buffers, idle_for=0):
+    ''' Ends the run in progress if no worker received anything for idle_for seconds, returns whether it did. '''
+    with buffers.writing():
+        idle = time.monotonic() * 1000 - buffers.meta[LAST_PACKET] >= idle_for * 1000
+        finished = bool(buffers.meta[ENTERED]) and idle
+        if finished:
+            buffers.meta[ENTERED] = 0
+            buffers.meta[RUNS_FINISHED] += 1     ##after finishing the run display table data
+    if finished:
+        print(disconnect_msg)
+    return finished
+
+
+def run_ingest(buffers, sock, keep_running=None, fpga_fields=None):
+    ''' Receives datagrams until the socket is closed, or until keep_running returns False when checked
+        after a timeout or a wake up without datagrams.
+    '''
+    print(" IN DATA UPDATER ")
+    receiver = BulkReceiver(sock)
+    ingestor = Ingestor(buffers, fpga_fields)
+    while True:
+        try:
+            batch = receiver.recv_batch()      ## every datagram queued on the socket, in one go
+        except socket.timeout:
+            finish_run(buffers, END_OF_RUN_TIMEOUT)    ## over once no worker received anything for a whole timeout
+            if keep_running is not None and not keep_running():
+                break
+            continue
+        except (OSError, ValueError):
+            break               ## socket closed
+        if not batch and keep_running is not None and not keep_running():
+            break               ## woken up by IngestThread.stop
+
+        drops = receiver.new_drops()
+        if(drops):
+            print(str(drops) + " datagrams dropped by the kernel, " + str(receiver.dropped) + " in total")
+
+        decoded = []
+        ended = False
+        for data, address in batch:
+            try:
+                if protocol.is_hello(data):          ## a sender asking which wire formats are understood
+                    sock.sendto(protocol.hello_reply(), address)
+                    continue
+                if protocol.is_end(data):
+                    ended = True
+                    continue
+                decoded.append(protocol.decode(data))     ## binary or text datagram, one or more samples
+            except Exception as e:
+                print("issue on datagram from " + str(address[0]) + " because: " + str(e))
+        if decoded:
+            with buffers.writing():
+                buffers.meta[DROPPED] += drops
+                try:
+                    ingestor.apply(np.concatenate(decoded))
+                except Exception as e:
+                    print("issue on batch because: " + str(e))
+        if ended:
+            finish_run(buffers)
+
+
+class IngestProtocol(asyncio.DatagramProtocol):
+    ''' Ingest running on an asyncio event loop, the Bokeh server's in asyncio mode, so that packets
+        are handled without a thread of their own. The transport hands over one datagram per loop
+        iteration, so datagrams are decoded as they arrive and written to the buffers in one batch
+        FLUSH_DELAY after the first of them. The run ends with the sender's END_MSG, or once an idle
+        timer finds no packet for END_OF_RUN_TIMEOUT. on_batch is called on the loop after every
+        write to the buffers, including the end of a run.
+    '''
+
+    def __init__(self, buffers, fpga_fields=None, on_batch=None):
+        self.buffers = buffers
+        self.ingestor = Ingestor(buffers, fpga_fields)
+        self.on_batch = on_batch
+        self.transport = None
+        self.loop = None
+        self.decoded = []           ## records decoded since the last flush
+        self.ended = False          ## END_MSG received since the last flush
+        self.flush_handle = None
+        self.idle_handle = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+
+    def datagram_received(self, data, address):
+        try:
+            if protocol.is_hello(data):
+                self.transport.sendto(protocol.hello_reply(), address)
+                return
+            if protocol.is_end(data):
+                self.ended = True
+            else:
+                self.decoded.append(protocol.decode(data))
+        except Exception as e:
+            print("issue on datagram from " + str(address[0]) + " because: " + str(e))
+            return
+        if self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(FLUSH_DELAY, self.flush)
+
+    def error_received(self, exc):
+        print("issue on the ingest socket because: " + str(exc))
+
+    def flush(self):
+        self.flush_handle = None
+        if self.decoded:
+            with self.buffers.writing():
+                try:
+                    self.ingestor.apply(np.concatenate(self.decoded))
+                except Exception as e:
+                    print("issue on batch because: " + str(e))
+            self.decoded = []
+            if self.idle_handle is None:
+                self.idle_handle = self.loop.call_later(END_OF_RUN_TIMEOUT, self._idle)
+        if self.ended:
+            self.ended = False
+            self._end_run()
+        if self.on_batch is not None:
+            self.on_batch()
+
+    def _idle(self):
+        ## Packets arrived since the timer was set, wait for the rest of the timeout after the latest one
+        remaining = self.buffers.meta[LAST_PACKET] / 1000 + END_OF_RUN_TIMEOUT - time.monotonic()
+        if remaining > 0:
+            self.idle_handle = self.loop.call_later(remaining, self._idle)
+            return
+        self._end_run()
+        if self.on_batch is not None:
+            self.on_batch()
+
+    def _end_run(self):
+        if self.idle_handle is not None:
+            self.idle_handle.cancel()
+            self.idle_handle = None
+        finish_run(self.buffers)
+
+    def close(self):
+        for handle in (self.flush_handle, self.idle_handle):
+            if handle is not None:
+                handle.cancel()
+        if self.transport is not None:
+            self.transport.close()
+
+
+def replay_store(buffers, store, interval=1.0, keep_running=None, fpga_fields=None):
+    ''' Writes the seconds of a RunStore into the buffers, one every interval seconds, as if they
+        had been received, then finishes the run.
+    '''
+    print(" REPLAYING " + store.path)
+    ingestor = Ingestor(buffers, fpga_fields)
+    for cidx, rows in store.seconds():
+        if keep_running is not None and not keep_running():
+            return
+        with buffers.writing():
+            ingestor.apply(wire_records(rows))      ## rows are a view of the mapped store
+        time.sleep(interval)
+    finish_run(buffers)
+
+
+class IngestThread(threading.Thread):
+    ''' Ingest thread of thread and store modes. target runs with a keep_running keyword that turns
+        False once stop is called; stop also wakes a target waiting on sock and closes it.
+    '''
+
+    def __init__(self, name, target, args, kwargs, sock=None):
+        self.stopping = threading.Event()
+        self.sock = sock
+        kwargs = dict(kwargs, keep_running=lambda: not self.stopping.is_set())
+        super().__init__(name=name, target=target, args=args, kwargs=kwargs, daemon=True)
+
+    def stop(self):
+        self.stopping.set()
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)    ## wakes the select even though it fails on UDP
+            except OSError:
+                pass
+        self.join(STOP_TIMEOUT)
+        if self.sock is not None:
+            self.sock.close()       ## releases the port for the next start_ingest
+
+
+def _ingest_process(buffers, addr, reuse_port, fpga_fields):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)     ## the dashboard process handles Ctrl-C
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)    ## a forked worker inherits the server's handler, which can't stop it
+    parent = multiprocessing.parent_process()       ## exit with the dashboard even if it was killed
+    run_ingest(buffers, open_socket(addr, reuse_port), keep_running=parent.is_alive, fpga_fields=fpga_fields)
+
+
+def start_ingest(addr, thread_count, core_count, mode="thread", workers=1, store=None, fpga_fields=None,
+                 on_batch=None):
+    ''' Starts the ingest and returns (buffers, handles), handles being the receiver threads or processes.
+        Process mode uses SO_REUSEPORT when workers > 1; the kernel assigns each sender to one worker.
+        Without fpga_fields the workers learn the board order together, in the shared buffers, under
+        the lock of the buffers. Store mode replays the run store at path store instead of listening on addr.
+        Asyncio mode listens on the current thread's event loop, which must be the one running the
+        server, and calls on_batch on it after every batch; its handle is the IngestProtocol.
+    '''
+    if mode == "asyncio":
+        buffers = IngestBuffers(thread_count, core_count)
+        ingest = IngestProtocol(buffers, fpga_fields, on_batch)
+        sock = open_socket(addr)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+        loop = asyncio.get_event_loop()
+        asyncio.ensure_future(loop.create_datagram_endpoint(lambda: ingest, sock=sock), loop=loop)  ## bound once the loop runs
+        return buffers, [ingest]
+    elif mode == "external":        ## written by the caller
+        return IngestBuffers(thread_count, core_count), []
+    elif mode == "store":
+        buffers = IngestBuffers(thread_count, core_count)
+        handles = [IngestThread('replay', replay_store, (buffers, RunStore(store)), {'fpga_fields' : fpga_fields})]
+    elif mode == "process":
+        buffers = IngestBuffers(thread_count, core_count, shared=True)
+        handles = [multiprocessing.Process(name="ingest" + str(i), target=_ingest_process,
+                                           args=(buffers, addr, workers > 1, fpga_fields), daemon=True)
+                   for i in range(workers)]
+        atexit.register(stop_ingest, buffers, handles)      ## release the segment on any clean exit
+    else:
+        buffers = IngestBuffers(thread_count, core_count)
+        sock = open_socket(addr)
+        handles = [IngestThread('data', run_ingest, (buffers, sock), {'fpga_fields' : fpga_fields}, sock)]
+    for handle in handles:
+        handle.start()
+    return buffers, handles
+
+
+def stop_ingest(buffers, handles):
+    for handle in handles:
+        if isinstance(handle, multiprocessing.Process):
+            handle.terminate()
+            handle.join(1)
+        elif isinstance(handle, IngestThread):
+            handle.stop()
+        elif isinstance(handle, IngestProtocol):
+            handle.close()
+    buffers.close(unlink=True)
@@ -0,0 +1,431 @@
+''' Server-side state shared by every session of the dashboard. Bokeh runs the app script once per
+    browser session, so the ingest, the aggregation of the hierarchy levels, the history of the
+    cache and idle charts and the table of finished runs live here instead, started once per server
+    and updated by a single thread whatever the number of viewers. In asyncio ingest mode there is no
+    such thread, the state is updated on the server's event loop when batches arrive, at most once
+    per refresh, and not at all between runs.
+
+    Sessions subscribe to the aggregated frames: the level a session shows and the number of the frame
+    are copied into a bounded SnapshotChannel per subscriber. Sessions read the history, the table and
+    the last frames of every level through accessors that hold the state's lock, up to the number of
+    the frame they render so that every chart shows the same second.
+    A subscriber's notify callable is called, possibly from another thread, whenever an update
+    changed something, so that sessions schedule their own document update instead of polling.
+'''
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+import numpy as np
+from poets.aggregation import HierarchyAggregator
+from poets.archive import RunArchive
+from poets.channel import SnapshotChannel
+from poets.coreseries import CoreSeries
+from poets.ingest import IngestBuffers, METRICS, SLOTS, start_ingest, stop_ingest
+from poets.pyramid import TimePyramid
+from poets.ringbuffer import RingBuffer
+from poets.runstats import RunStats
+from poets.topology import LEVELS, Topology
+
+# Socket Configurations
+############################################################################
+PORT = 5064
+ADDR = ("::1", PORT)  ## local address for now
+
+
+# State Configurations
+############################################################################
+REFRESH = 0.9           ## seconds between two updates of the shared state
+TABLE_ROWS = 10         ## finished runs listed in the table
+SPACING_FRAMES = 3      ## empty frames published after a run, to space application runs on the live line
+FRAME_POLICY = "oldest"     ## what a session renders from its channel, see poets.channel
+FRAME_CAPACITY = 8          ## frames a lagging session keeps before dropping the oldest
+LINE_WINDOW = 4             ## frames kept for the live line of every hierarchy level
+CLOCK = 2100000         ## idle counter ticks per second and core over 100, freq is 210 MHz
+
+## Values of every second kept in the history pyramid
+H_MISS, H_HIT, H_WB, H_IDLE = range(4)
+MISS, HIT, WB, IDLE, REPORTED = (METRICS.index(m) for m in ["cache_miss", "cache_hit", "cache_wb", "cpu_idle", "reported"])
+
+
+class LiveState:
+    ''' Ingest and everything derived from it, for all the sessions of one server. '''
+
+    def __init__(self, topology, addr=ADDR, mode="thread", workers=1, store=None, refresh=REFRESH,
+                 frame_policy=FRAME_POLICY, frame_capacity=FRAME_CAPACITY, archive=None, line_window=LINE_WINDOW):
+        self.topology = topology
+        self.thread_count = topology.thread_count
+        self.core_count = topology.counts["CORE"]
+        self.refresh = refresh
+        self.frame_policy = frame_policy
+        self.frame_capacity = frame_capacity
+        self.lock = threading.Lock()        ## guards what sessions read: history, table and subscribers
+
+        self.aggregator = HierarchyAggregator(topology)     ## computes every hierarchy level once per tick
+        self.view = IngestBuffers(self.thread_count, self.core_count)           ## snapshot of the ingest buffers
+        self.published = np.zeros(self.thread_count, dtype=np.uint16)         ## thread level of the latest frame
+        self.seen_batch = 0         ## latest ingest batch whose cores were looked at
+        self.empty_frame = {level : np.zeros(0, dtype=np.int64) for level in LEVELS}
+        self.subscribers = dict()
+        ## Last line_window frames of every level, numbered from the start of the server, so that a session
+        ## switching the level of its live line draws it with its history. The lines start flat at zero
+        self.line_window = line_window
+        self.lines = {level : RingBuffer(count, line_window) for level, count in topology.counts.items()}
+        for number in range(line_window):
+            for ring in self.lines.values():
+                ring.append(number, ())
+        self.frame_number = line_window     ## number of the next frame published
+
+        self.history = TimePyramid(4)       ## per second: cache miss, hit and wb per core, idle percentage
+        self.cores = CoreSeries(self.core_count, len(METRICS))      ## per second and core: every counter of the run
+        self.history_version = 0            ## incremented whenever the history changes
+        self.execution = np.zeros(TABLE_ROWS, dtype=np.int64)
+        self.usage = np.zeros(TABLE_ROWS)
+        self.table_version = 0              ## incremented whenever a run is added to the table
+        self.archive = RunArchive(archive) if archive else None     ## every finished run, if an archive directory is given
+
+        self.run_id = 0             # Run whose data the history holds
+        self.runs_seen = 0          # Finished runs already added to the table
+        self.run_last = -1          # Latest second seen of the run whose data the history holds
+        self.finished_run = 0       # Latest run added to the table
+        self.next_second = 0        # First second of the run not yet added to the history
+        self.stored_second = 0      # First second of the run not yet added to the per-core series
+        self.stats = RunStats(topology.counts)      # Running statistics of the frames published during the run
+        self.last_summary = None    # Summary of the latest finished run
+
+        self.running = True
+        self.updater = None
+        self.pending = None         ## update scheduled on the loop in asyncio mode
+        if mode == "asyncio":       ## updated on the event loop, after the batches of the ingest
+            self.loop = asyncio.get_event_loop()
+            self.updated_at = 0.0
+            self.buffers, self.handles = start_ingest(addr, self.thread_count, self.core_count, mode,
+                                                      fpga_fields=topology.fpga_fields, on_batch=self._batch_arrived)
+        else:
+            self.buffers, self.handles = start_ingest(addr, self.thread_count, self.core_count, mode, workers, store,
+                                                      fpga_fields=topology.fpga_fields)
+            if refresh is not None:         ## otherwise the caller runs update itself, e.g. poets.bench
+                self.updater = threading.Thread(name='buffer', target=self._run, daemon=True)
+                self.updater.start()
+
+    @classmethod
+    def from_environment(cls):
+        ''' State configured by the POETS_* environment variables:
+              POETS_INGEST_MODE     "thread" parses packets in a thread of the server, "process" in separate receiver
+                                    processes writing to shared memory, so that parsing doesn't compete with rendering
+                                    for the GIL, "store" replays the run store at POETS_RUN_STORE without the socket,
+                                    "asyncio" receives on the server's event loop and updates as batches arrive
+              POETS_INGEST_WORKERS  number of receiver processes
+              POETS_TOPOLOGY        topology file describing the deployment, see poets.topology, otherwise 8 boxes
+              POETS_FRAME_POLICY    "oldest", "latest" or "keep", what a session renders when it lags, see poets.channel
+              POETS_FRAME_CAPACITY  frames a lagging session keeps
+              POETS_ARCHIVE         directory where every finished run is archived, see poets.archive
+              POETS_LINE_WINDOW     frames kept for the live line of every level
+        '''
+        topology_file = os.environ.get("POETS_TOPOLOGY")
+        topology = Topology.load(topology_file) if topology_file else Topology()
+        return cls(topology,
+                   mode=os.environ.get("POETS_INGEST_MODE", "thread"),
+                   workers=int(os.environ.get("POETS_INGEST_WORKERS", "1")),
+                   store=os.environ.get("POETS_RUN_STORE"),
+                   frame_policy=os.environ.get("POETS_FRAME_POLICY", FRAME_POLICY),
+                   frame_capacity=int(os.environ.get("POETS_FRAME_CAPACITY", str(FRAME_CAPACITY))),
+                   archive=os.environ.get("POETS_ARCHIVE"),
+                   line_window=int(os.environ.get("POETS_LINE_WINDOW", str(LINE_WINDOW))))
+
+    def stop(self):
+        self.running = False
+        if self.pending is not None:
+            self.pending.cancel()
+        stop_ingest(self.buffers, self.handles)
+
+    # Sessions
+    ############################################################################
+    def subscribe(self, key, notify=None, level="CORE"):
+        ''' SnapshotChannel receiving the frames published from now on, starting with an empty one. A
+            frame holds the values of level, the level the session shows, and its number under "frame".
+            notify is called without arguments after every update that published a frame or changed
+            the history or the table.
+        '''
+        ## Means of uint16 thread levels, preallocated for every element of every level so that a session
+        ## can switch level without a new channel
+        dtypes = dict.fromkeys(self.topology.counts, np.uint16)
+        dtypes["frame"] = np.int64
+        frames = SnapshotChannel(dict(self.topology.counts, frame=1), dtypes, self.frame_capacity, self.frame_policy)
+        with self.lock:
+            frames.put({level : self.empty_frame[level], "frame" : (self.frame_number - 1,)})     ## so the charts are drawn before the first run
+            self.subscribers[key] = (frames, notify, level)
+        return frames
+
+    def show(self, key, level):
+        ''' Level whose values the frames of subscriber key hold from the next frame published on. '''
+        with self.lock:
+            frames, notify, _ = self.subscribers[key]
+            self.subscribers[key] = (frames, notify, level)
+
+    def unsubscribe(self, key):
+        with self.lock:
+            self.subscribers.pop(key, None)
+
+    def publish(self, frame):
+        with self.lock:
+            for level, ring in self.lines.items():
+                ring.append(self.frame_number, frame[level])
+            for frames, _, level in self.subscribers.values():
+                frames.put({level : frame[level], "frame" : (self.frame_number,)})
+            self.frame_number += 1
+
+    def line_points(self, level, since=None, elements=None, until=None):
+        ''' Frame numbers and (elements x points) values of the live line of level: frame since and the
+            frames published after it, or every frame kept when since is None, oldest first, up to frame
+            until if given. Only the given elements are returned if elements isn't None.
+        '''
+        with self.lock:
+            ring = self.lines[level]
+            numbers, values = ring.ordered(None if since is None else self.frame_number - since)
+        if until is not None:
+            kept = numbers <= until
+            numbers, values = numbers[kept], values[:, kept]
+        return numbers, values if elements is None else values[elements]
+
+    def metrics(self):
+        ''' Channel statistics of every subscriber, depth being the number of frames waiting to be rendered. '''
+        with self.lock:
+            channels = list(self.subscribers.items())
+        return {key : frames.stats() for key, (frames, _, _) in channels}
+
+    def notify(self):
+        with self.lock:
+            callbacks = [notify for _, notify, _ in self.subscribers.values() if notify is not None]
+        for notify in callbacks:
+            notify()
+
+    def history_series(self, span, start=0, end=None):
+        ''' History of the seconds [start, end) at the level matching span seconds, see TimePyramid.series. '''
+        with self.lock:
+            return self.history.series(self.history.level_for(span), start, end)
+
+    def whole_history(self):
+        with self.lock:
+            return self.history.series(self.history.level_for(self.history.seconds))
+
+    def table(self):
+        ''' Execution time and average utilisation of the latest finished runs, newest first. '''
+        with self.lock:
+            return self.execution.copy(), self.usage.copy()
+
+    def subtree(self, level, index):
+        ''' Children of element index of level, sliced on demand from the thread levels last published:
+            (child level, child indices, their mean TX/s, cores contained in the element). A thread
+            has no children and is returned as its own only child.
+        '''
+        sizes = self.topology.sizes
+        child = LEVELS[max(LEVELS.index(level) - 1, 0)]
+        first = index * sizes[level]
+        last = min(first + sizes[level], self.thread_count)
+        with self.lock:     ## published is written by update
+            threads = self.published[first:last].astype(np.int64)
+        values = threads.reshape(-1, sizes[child]).sum(axis=1) // sizes[child]     ## like the aggregator
+        children = np.unique(self.topology.thread_index[child][first:last])
+        cores = np.unique(self.topology.thread_index["CORE"][first:last])
+        return child, children, values, cores
+
+    def core_history(self, cores, start=0, end=None):
+        ''' (seconds x METRICS) sums of the counters of the given cores, an index or an array of indices,
+            over the seconds [start, end) of the current run.
+        '''
+        with self.lock:
+            end = self.cores.seconds if end is None else end
+            return self.cores.totals(start, end, np.atleast_1d(cores))
+
+    def archived_runs(self):
+        ''' Catalog rows of the archived runs, newest first, none without an archive. '''
+        return self.archive.runs() if self.archive is not None else []
+
+    def archived_series(self, run_id):
+        return self.archive.series(run_id)
+
+    def _archive_run(self, summary, seconds):
+        ''' Writes a finished run to the archive, seconds being its history with one bucket per second.
+            Called without the lock, the database and the files can be slow to write.
+        '''
+        mean = seconds['mean']
+        try:
+            run_id = self.archive.add(summary, {"second" : seconds['x'],
+                                                "miss" : mean[:, H_MISS],
+                                                "hit" : mean[:, H_HIT],
+                                                "wb" : mean[:, H_WB],
+                                                "idle" : mean[:, H_IDLE]})
+            print("run archived as " + str(run_id))
+        except Exception as e:
+            print("issue archiving the run because: " + str(e))
+
+    def _add_history(self, last):
+        ''' Adds the seconds of the per-core series up to last not added yet to the history, returns whether there were any. '''
+        if(last < self.next_second):
+            return False
+        with self.lock:
+            totals = self.cores.totals(self.next_second, last + 1)     ## system-wide sums, one reduction over the cores
+        idle = totals[:, IDLE]/(self.core_count*CLOCK) + (self.core_count-totals[:, REPORTED])/(self.core_count/100)
+        with self.lock:
+            for i in range(len(totals)):
+                self.history.append(self.next_second + i, [totals[i, MISS]/self.core_count, totals[i, HIT]/self.core_count,
+                                                           totals[i, WB]/self.core_count, idle[i]])
+            self.next_second += len(totals)
+            self.history_version += 1
+        return True
+
+    def _finish_run(self, max_cidx):
+        ''' Adds the run whose data the history holds, max_cidx being its latest second, to the table and the archive. '''
+        print(" RENDERING OTHER GRAPHS ")
+        with self.lock:
+            self.execution = np.roll(self.execution, 1)
+            self.execution[0] = max_cidx
+            self.usage = np.roll(self.usage, 1)
+            self.usage[0] = self.stats.utilisation(max_cidx)
+            self.last_summary = self.stats.summary(max_cidx)
+            seconds = self.history.series(0) if self.archive is not None else None     ## a copy, one bucket per second
+        if seconds is not None:
+            self._archive_run(self.last_summary, seconds)
+        with self.lock:
+            self.table_version += 1         ## after archiving, so that sessions list the run with the table
+        for _ in range(SPACING_FRAMES):     ## void data sets to space application runs
+            self.publish(self.empty_frame)
+        self.stats.clear()
+        self.finished_run = self.run_id
+
+    # Updater
+    ############################################################################
+    def _run(self):
+        while self.running:
+            try:
+                self.update()
+            except Exception as e:
+                print("issue updating the shared state because: " + str(e))
+            time.sleep(self.refresh)
+
+    def _batch_arrived(self):
+        ''' Called on the event loop after every ingest batch in asyncio mode, updates at most once per refresh. '''
+        if self.pending is None and self.running:
+            delay = max(0.0, self.updated_at + self.refresh - time.monotonic())
+            self.pending = self.loop.call_later(delay, self._scheduled_update)
+
+    def _scheduled_update(self):
+        self.pending = None
+        self.updated_at = time.monotonic()
+        try:
+            pending = self.update()
+        except Exception as e:
+            print("issue updating the shared state because: " + str(e))
+            return
+        if pending:         ## a finished run still has history to add, no batch will come to trigger it
+            self._batch_arrived()
+
+    def update(self):
+        ''' Brings the shared state up to date with the ingest buffers and notifies the subscribers if
+            anything changed. Returns True while a finished run hasn't been added to the table yet.
+        '''
+        view = self.view
+        self.buffers.copy_to(view, self.stored_second)      ## consistent snapshot, seconds not stored yet only
+        if(view.run_id != self.run_id) and self.stored_second:
+            self.buffers.copy_to(view)          ## the new run's seconds start over
+        changed = False
+
+        if(view.run_id != self.run_id):      ## a new run started, clear the previous run's history
+            changed = True
+            if(self.finished_run != self.run_id):
+                ## The previous run ended and the next one started between two updates, e.g. a looped replay:
+                ## it is added to the table with the seconds stored, its slots now hold the new run's seconds
+                with self.lock:
+                    self.cores.advance(self.run_last + 1)
+                self._add_history(self.run_last)
+                self._finish_run(self.run_last)
+            ## Runs that ended before an update saw them are skipped, the new one is counted unless it is over too
+            self.runs_seen = view.runs_finished - (0 if view.entered else 1)
+            with self.lock:
+                self.run_id = view.run_id
+                self.run_last = -1
+                self.next_second = 0
+                self.stored_second = 0
+                self.stats.clear()
+                self.cores.clear()
+                self.history.clear()
+                self.history_version += 1
+
+        dirty = view.dirty_cores(self.seen_batch)      ## cores written since the previous update
+        self.seen_batch = view.batches
+        if(view.entered) and len(dirty):
+            threads = view.thread_level.reshape(self.core_count, -1)
+            published = self.published.reshape(self.core_count, -1)
+            dirty = dirty[(threads[dirty] != published[dirty]).any(axis=1)]      ## written with different values
+            if len(dirty):
+                with self.lock:         ## read by subtree
+                    published[dirty] = threads[dirty]
+                levels, _ = self.aggregator.update_cores(self.published, view.biggest, dirty)   ## only the elements containing them
+                self.publish(levels)        ## copied by every channel
+                self.stats.add(levels)
+                changed = True
+
+        self.run_last = view.max_cidx
+        finished = view.runs_finished != self.runs_seen
+        last = view.max_cidx if finished else view.max_cidx - 1     ## a second is complete once a newer one arrived
+        if(last >= self.stored_second):
+            ## Completed seconds still in their slot, a second never received or whose slot was already
+            ## reused stays missing, and is a gap in the charts rather than an idle second
+            seconds = np.arange(self.stored_second, last + 1)
+            slots = seconds % SLOTS
+            held = view.slot_cidx[slots] == seconds
+            if not(held.all()):
+                print(str(int((~held).sum())) + " seconds of per-core counters missing, shown as gaps")
+            with self.lock:
+                self.cores.write(seconds[held], view.core_seconds[slots[held]])     ## one scatter for all of them
+                self.cores.advance(last + 1)
+            self.stored_second = last + 1
+
+        if(self._add_history(last)):        ## every completed second, however many arrived since the last update
+            changed = True
+
+        if(finished) and (self.next_second > view.max_cidx):
+            self._finish_run(view.max_cidx)
+            self.runs_seen = view.runs_finished
+            changed = True
+
+        if(changed):
+            self.notify()
+        return view.runs_finished != self.runs_seen
+
+
+# Shared instance
+############################################################################
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def _signal_handler(*args, **kwargs):
+    print("\nTerminating Visualiser...")
+    stop_shared()
+    print(f"active  {threading.active_count()}")
+    sys.exit(0)
+
+
+def shared():
+    ''' The state shared by every session, started from the environment on first use. The server
+        starts it in on_server_loaded, so that it runs before the first browser connects.
+    '''
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = LiveState.from_environment()
+            if threading.current_thread() is threading.main_thread():
+                signal.signal(signal.SIGINT, _signal_handler)       # Interrupt handler
+        return _shared
+
+
+def stop_shared():
+    global _shared
+    with _shared_lock:
+        if _shared is not None:
+            _shared.stop()
+            _shared = None
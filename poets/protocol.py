@@ -0,0 +1,130 @@
+''' Wire format of the instrumentation packets exchanged between the senders and the dashboard.
+    Two formats are supported:
+      - text: the original format, one sample per datagram made of eight numbers joined by API_DELIMINATOR
+      - binary: a versioned header followed by fixed-size little-endian records, many per datagram
+    The receiver tells the two apart by the magic bytes at the start of every binary datagram, and a
+    sender can negotiate the format by sending HELLO_MSG and waiting for the receiver's reply.
+    Binary datagrams are filled up to MTU_PAYLOAD; text stays one sample per datagram because that is
+    what receivers predating the binary format expect. A sender ends a run explicitly with END_MSG,
+    receivers also end it after a while without packets for senders that don't.
+'''
+import struct
+import numpy as np
+
+# Format Configurations
+############################################################################
+API_DELIMINATOR = "-"
+MAGIC = b"PV"
+VERSION = 1
+SUPPORTED_VERSIONS = (1,)
+HEADER = struct.Struct("<2sBxI")    ## magic, version, padding, number of records
+HELLO_MSG = b"HELLO"                ## sent by a sender that wants to know which formats the receiver speaks
+END_MSG = b"END"                    ## sent by a sender once the run is over
+MTU_PAYLOAD = 1500 - 40 - 8         ## largest UDP payload that avoids IPv6 fragmentation on an Ethernet MTU
+
+## One instrumentation sample, the fields are the same eight values carried by the text format
+RECORD = np.dtype([("thread_id", "<u4"),
+                   ("cidx", "<u4"),
+                   ("blocked", "<u4"),
+                   ("cache_miss", "<u4"),
+                   ("cache_hit", "<u4"),
+                   ("cache_wb", "<u4"),
+                   ("cpu_idle", "<u4"),
+                   ("tx_per_s", "<f4")])
+
+## Columns of the instrumentation CSV that make up a record, in RECORD order
+## (ThreadID, cIDX, Blocked, CacheMiss, CacheHit, CacheWB, CPUIdle, TX/s)
+CSV_COLUMNS = (0, 1, 12, 13, 14, 15, 16, 18)
+
+
+class ProtocolError(ValueError):
+    ''' Raised when a datagram can't be decoded. '''
+
+
+def from_rows(rows):
+    ''' Converts rows of eight numbers, laid out as CSV_COLUMNS, into a RECORD array. '''
+    rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+    records = np.empty(len(rows), dtype=RECORD)
+    for i, name in enumerate(RECORD.names):
+        records[name] = rows[:, i]
+    return records
+
+
+def encode_binary(records):
+    ''' Packs a RECORD array into one binary datagram. '''
+    records = np.atleast_1d(np.asarray(records, dtype=RECORD))
+    return HEADER.pack(MAGIC, VERSION, len(records)) + records.tobytes()
+
+
+def records_per_datagram(max_size=MTU_PAYLOAD):
+    return (max_size - HEADER.size) // RECORD.itemsize
+
+
+def pack(records, max_size=MTU_PAYLOAD):
+    ''' Splits a RECORD array into binary datagrams holding as many records as fit in max_size bytes. '''
+    step = records_per_datagram(max_size)
+    for start in range(0, len(records), step):
+        yield encode_binary(records[start:start + step])
+
+
+def encode_text(record):
+    ''' Formats a single record the way the original senders did. '''
+    return API_DELIMINATOR.join(str(float(record[name])) for name in RECORD.names).encode('utf-8')
+
+
+def decode(datagram):
+    ''' Returns the RECORD array carried by a datagram of either format. '''
+    if datagram[:len(MAGIC)] == MAGIC:
+        return decode_binary(datagram)
+    return decode_text(datagram)
+
+
+def decode_binary(datagram):
+    if len(datagram) < HEADER.size:
+        raise ProtocolError("datagram shorter than the header")
+    magic, version, count = HEADER.unpack_from(datagram)
+    if version not in SUPPORTED_VERSIONS:
+        raise ProtocolError("unsupported protocol version " + str(version))
+    if len(datagram) != HEADER.size + count * RECORD.itemsize:
+        raise ProtocolError("datagram length doesn't match its record count")
+    return np.frombuffer(datagram, dtype=RECORD, count=count, offset=HEADER.size)
+
+
+def decode_text(datagram):
+    splitMsg = datagram.decode("utf-8").split(API_DELIMINATOR)
+    if len(splitMsg) != len(RECORD.names):
+        raise ProtocolError("text datagram doesn't have " + str(len(RECORD.names)) + " fields")
+    return from_rows([float(x) for x in splitMsg])
+
+
+# Format negotiation
+############################################################################
+def is_hello(datagram):
+    return datagram == HELLO_MSG
+
+
+def is_end(datagram):
+    return datagram == END_MSG
+
+
+def hello_reply():
+    ''' Reply of a receiver to HELLO_MSG, listing the binary versions it understands. '''
+    return MAGIC + bytes(SUPPORTED_VERSIONS)
+
+
+def negotiate(sock, addr, timeout=1.0):
+    ''' Asks the receiver at addr which format to use. Returns "binary" if it replies with a version
+        this sender supports, otherwise "text" so that receivers predating the binary format still work.
+    '''
+    previous = sock.gettimeout()
+    sock.settimeout(timeout)
+    try:
+        sock.sendto(HELLO_MSG, addr)
+        reply, _ = sock.recvfrom(64)
+        if reply[:len(MAGIC)] == MAGIC and VERSION in reply[len(MAGIC):]:
+            return "binary"
+    except OSError:                 ## timeout or nothing listening
+        pass
+    finally:
+        sock.settimeout(previous)
+    return "text"
@@ -0,0 +1,105 @@
+''' Multi-resolution history of per-second values. Every level of the pyramid splits time into
+    buckets of a fixed number of seconds and keeps the min, max and mean of each value per bucket.
+    Levels are updated together as each second is appended, so no level is ever recomputed, and a
+    chart can ask for the coarsest level that still shows a time range with enough points, which
+    bounds what it has to send to the browser however long the run is.
+'''
+import numpy as np
+
+# Pyramid Configurations
+############################################################################
+FACTORS = (1, 10, 60, 600, 3600)        ## seconds per bucket of each level
+MAX_POINTS = 500                        ## points a chart should show at most
+INITIAL_BUCKETS = 1024
+
+
+class _Level:
+    ''' Buckets of one resolution, the arrays grow by doubling. '''
+
+    def __init__(self, factor, values):
+        self.factor = factor
+        self.size = 0           ## number of buckets in use
+        self.low = np.empty((INITIAL_BUCKETS, values))
+        self.high = np.empty((INITIAL_BUCKETS, values))
+        self.sum = np.empty((INITIAL_BUCKETS, values))
+        self.count = np.empty(INITIAL_BUCKETS, dtype=np.int64)
+
+    def _grow(self, size):
+        capacity = len(self.count)
+        while capacity < size:
+            capacity *= 2
+        for name in ("low", "high", "sum", "count"):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, second, values):
+        ''' Adds the values of a second to its bucket, a second with a NaN value only opens it. '''
+        bucket = second // self.factor
+        if bucket >= self.size:         ## open the bucket, and any empty bucket before it
+            if bucket >= len(self.count):
+                self._grow(bucket + 1)
+            self.low[self.size:bucket + 1] = np.inf
+            self.high[self.size:bucket + 1] = -np.inf
+            self.sum[self.size:bucket + 1] = 0
+            self.count[self.size:bucket + 1] = 0
+            self.size = bucket + 1
+        if np.isnan(values).any():      ## a second that wasn't received
+            return
+        np.minimum(self.low[bucket], values, out=self.low[bucket])
+        np.maximum(self.high[bucket], values, out=self.high[bucket])
+        self.sum[bucket] += values
+        self.count[bucket] += 1
+
+
+class TimePyramid:
+    ''' Per-second values of a run at every resolution in factors. '''
+
+    def __init__(self, values, factors=FACTORS):
+        self.values = values
+        self.factors = factors
+        self.clear()
+
+    def clear(self):
+        self.levels = [_Level(factor, self.values) for factor in self.factors]
+        self.seconds = 0        ## one past the latest second appended
+
+    def append(self, second, values):
+        ''' Adds the values of one second, seconds must be appended in increasing order. A second
+            that wasn't received is appended with NaN values, and leaves its buckets empty if alone in them.
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        for level in self.levels:
+            level.add(second, values)
+        self.seconds = max(self.seconds, second + 1)
+
+    def level_for(self, span, max_points=MAX_POINTS):
+        ''' Index of the finest level showing span seconds in at most max_points buckets. '''
+        for i, factor in enumerate(self.factors):
+            if span / factor <= max_points:
+                return i
+        return len(self.factors) - 1
+
+    def series(self, level, start=0, end=None):
+        ''' Buckets of a level overlapping the seconds [start, end), as a dict of arrays: the centre
+            second of each bucket and the (buckets x values) mean, min and max. Empty buckets are NaN.
+        '''
+        level = self.levels[level]
+        end = self.seconds if end is None else end
+        first = max(int(start) // level.factor, 0)
+        last = min(int(np.ceil(end / level.factor)), level.size)
+        first = min(first, last)
+        count = level.count[first:last]
+        empty = count == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = level.sum[first:last] / count[:, None]
+        low = level.low[first:last].copy()
+        high = level.high[first:last].copy()
+        low[empty] = np.nan
+        high[empty] = np.nan
+        return {'x' : np.arange(first, last) * level.factor + (level.factor - 1) / 2,
+                'mean' : mean,
+                'low' : low,
+                'high' : high,
+                'factor' : level.factor}
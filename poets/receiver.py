@@ -0,0 +1,72 @@
+''' Bulk UDP receive for the dashboard. Python has no recvmmsg, so the receiver waits for the first
+    datagram with select and then drains everything already queued on the socket without blocking,
+    which costs one wake-up per burst instead of one per datagram. The socket receive buffer is
+    enlarged so bursts at each second boundary fit in the kernel queue, and on Linux the number of
+    datagrams the kernel dropped because that queue was full is read from SO_RXQ_OVFL. The kernel
+    reports that count with the first datagram queued after the drops, so it lags by one datagram.
+'''
+import select
+import socket
+import struct
+
+# Receiver Configurations
+############################################################################
+RCVBUF_SIZE = 8 * 1024 * 1024     ## requested receive buffer, Linux caps it to net.core.rmem_max
+BATCH_SIZE = 512                  ## maximum number of datagrams returned by one recv_batch call
+MAX_DATAGRAM = 65535
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40)    ## not exported by every Python build, 40 on Linux
+
+
+class BulkReceiver:
+    ''' Wraps a bound UDP socket. recv_batch returns a list of (data, address) tuples and raises
+        socket.timeout when nothing arrives within timeout seconds, like recvfrom on a socket with a timeout.
+    '''
+
+    def __init__(self, sock, timeout=None, batch_size=BATCH_SIZE, rcvbuf=RCVBUF_SIZE):
+        self.sock = sock
+        self.timeout = sock.gettimeout() if timeout is None else timeout
+        self.batch_size = batch_size
+        self.dropped = 0            ## datagrams dropped by the kernel since the socket was opened
+        self._reported = 0
+        sock.setblocking(False)
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        except OSError as e:
+            print("Couldn't enlarge the receive buffer because " + str(e))
+        self.rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if self.rcvbuf < rcvbuf:
+            print("Receive buffer is " + str(self.rcvbuf) + " bytes, raise net.core.rmem_max to get " + str(rcvbuf))
+
+        self.count_drops = hasattr(sock, "recvmsg")
+        if self.count_drops:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            except OSError:
+                self.count_drops = False     ## not Linux, drops can't be counted
+
+    def recv_batch(self):
+        readable, _, _ = select.select([self.sock], [], [], self.timeout)
+        if not readable:
+            raise socket.timeout("no datagram received in " + str(self.timeout) + " seconds")
+
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                if self.count_drops:
+                    data, ancdata, _, address = self.sock.recvmsg(MAX_DATAGRAM, socket.CMSG_SPACE(4))
+                    for level, kind, cdata in ancdata:
+                        if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                            self.dropped = struct.unpack("I", cdata[:4])[0]
+                else:
+                    data, address = self.sock.recvfrom(MAX_DATAGRAM)
+            except BlockingIOError:
+                break           ## socket drained
+            batch.append((data, address))
+        return batch
+
+    def new_drops(self):
+        ''' Number of datagrams dropped by the kernel since the last call. '''
+        drops = self.dropped - self._reported
+        self._reported = self.dropped
+        return drops
@@ -0,0 +1,50 @@
+''' Fixed-length history of many series sampled together, used as the backing store of the live charts.
+    Samples are kept in an (entities x window) array written column by column, so adding a sample is a
+    single column assignment and the oldest sample is overwritten without moving the others.
+'''
+import numpy as np
+
+
+class RingBuffer:
+    ''' The last window samples of entities series, plus the time of each sample. '''
+
+    def __init__(self, entities, window, dtype=np.float64):
+        if window < 2:
+            raise ValueError("window must hold at least two samples")
+        self.entities = entities
+        self.window = window
+        self.data = np.zeros((entities, window), dtype=dtype)
+        self.times = np.zeros(window)
+        self.head = 0       ## column written by the next append
+        self.count = 0      ## number of samples held, at most window
+
+    def append(self, time, values):
+        ''' Adds one sample of every series, series missing from values are set to zero. '''
+        values = np.asarray(values)[:self.entities]
+        column = self.data[:, self.head]
+        column[:len(values)] = values
+        column[len(values):] = 0
+        self.times[self.head] = time
+        self.head = (self.head + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+
+    def column(self, age=0):
+        ''' Index of the sample appended age appends ago, 0 being the latest. '''
+        return (self.head - 1 - age) % self.window
+
+    def latest(self, age=0):
+        ''' Time and values of the sample appended age appends ago. '''
+        i = self.column(age)
+        return self.times[i], self.data[:, i]
+
+    def ordered(self, last=None):
+        ''' Times and (entities x count) values of the held samples, oldest first, or of the last ones only. '''
+        count = self.count if last is None else min(last, self.count)
+        order = (self.head - count + np.arange(count)) % self.window
+        return self.times[order], self.data[:, order]
+
+    def clear(self):
+        self.data[:] = 0
+        self.times[:] = 0
+        self.head = 0
+        self.count = 0
@@ -0,0 +1,73 @@
+''' Statistics of a run accumulated frame by frame, so that the post-run table row and the summary
+    of the run are available as soon as it ends. Every frame adds its per-level arrays to running
+    sums and maxima with one NumPy operation per level, and its thread values to a histogram of the
+    whole uint16 TX/s range, from which percentiles are read without keeping the samples.
+'''
+import numpy as np
+
+# Statistics Configurations
+############################################################################
+HISTOGRAM_BINS = 1 << 16        ## one bin per uint16 TX/s value, percentiles are exact
+PERCENTILES = (50, 95, 99)
+
+
+class RunStats:
+    ''' Running statistics of the frames of one run, counts[level] being the number of elements of each level. '''
+
+    def __init__(self, counts):
+        self.counts = dict(counts)
+        self.sums = {level : np.zeros(count, dtype=np.int64) for level, count in self.counts.items()}
+        self.peaks = {level : np.zeros(count, dtype=np.int64) for level, count in self.counts.items()}
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        self.clear()
+
+    def clear(self):
+        self.samples = 0            ## frames added
+        self.total = 0              ## sum of the thread values of every frame
+        self.low = 0                ## lowest and highest sum of the thread values of one frame
+        self.high = 0
+        for level in self.counts:
+            self.sums[level][:] = 0
+            self.peaks[level][:] = 0
+        self.histogram[:] = 0
+
+    def add(self, levels):
+        ''' Adds a frame, a dict of per-level arrays covering the active elements of each level. '''
+        threads = levels["THREAD"]
+        frame_total = int(threads.sum())
+        self.low = frame_total if self.samples == 0 else min(self.low, frame_total)
+        self.high = max(self.high, frame_total)
+        self.total += frame_total
+        self.samples += 1
+        for level, values in levels.items():
+            n = min(len(values), self.counts[level])
+            self.sums[level][:n] += values[:n]
+            np.maximum(self.peaks[level][:n], values[:n], out=self.peaks[level][:n])
+        self.histogram += np.bincount(threads.astype(np.int64), minlength=HISTOGRAM_BINS)[:HISTOGRAM_BINS]
+
+    def utilisation(self, seconds):
+        ''' Average Utilisation column of the table: thread values of the run per second of execution. '''
+        return round(self.total/max(seconds, 1), 3)
+
+    def mean(self, level):
+        ''' Mean of every element of level over the frames of the run. '''
+        return self.sums[level] / max(self.samples, 1)
+
+    def percentile(self, q):
+        ''' TX/s value below which q percent of the thread samples of the run fall. '''
+        cumulative = np.cumsum(self.histogram)
+        if not cumulative[-1]:
+            return 0
+        return int(np.searchsorted(cumulative, cumulative[-1] * q / 100))
+
+    def summary(self, seconds):
+        ''' Scalars describing the run, for the table and the run archive. '''
+        summary = {"seconds" : seconds,
+                   "frames" : self.samples,
+                   "utilisation" : self.utilisation(seconds),
+                   "frame_low" : self.low,
+                   "frame_high" : self.high,
+                   "frame_mean" : self.total / max(self.samples, 1)}
+        for q in PERCENTILES:
+            summary["p" + str(q)] = self.percentile(q)
+        return summary
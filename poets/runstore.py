@@ -0,0 +1,156 @@
+''' Columnar on-disk store of recorded runs. A store is a directory holding
+      - records.npy: every sample of the run as a RUN_RECORD array sorted by (cIDX, ThreadID)
+      - index.npy:   offsets such that the samples of cIDX c are records[index[c]:index[c + 1]]
+    Both files are plain .npy files opened with np.load(mmap_mode="r"), so opening a store is instant
+    and slicing a second out of it is a zero-copy view of the mapped file. Stores are written once by
+    the converters below, from the single instrumentation CSV or from the per-thread CSV files.
+
+    Usage: python -m poets.runstore new_data/instrumentation.csv runs/instrumentation
+           python -m poets.runstore visualiser_data runs/visualiser_data
+'''
+import argparse
+import os
+import shutil
+import numpy as np
+from poets import csvreader, protocol
+from poets.csvreader import RUN_RECORD
+
+# Store Configurations
+############################################################################
+RECORDS_FILE = "records.npy"
+INDEX_FILE = "index.npy"
+
+
+class RunStore:
+    ''' A store opened read-only. Arrays returned by its methods are views of the mapped files. '''
+
+    def __init__(self, path):
+        self.path = path
+        self.records = np.load(os.path.join(path, RECORDS_FILE), mmap_mode="r")
+        self.index = np.load(os.path.join(path, INDEX_FILE), mmap_mode="r")
+        if self.records.dtype != RUN_RECORD:
+            raise ValueError(path + " wasn't written with this version of the store")
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def max_cidx(self):
+        return len(self.index) - 2
+
+    def second(self, cidx):
+        ''' Samples of one cIDX, sorted by ThreadID. '''
+        if not 0 <= cidx <= self.max_cidx:
+            return self.records[:0]
+        return self.records[self.index[cidx]:self.index[cidx + 1]]
+
+    def seconds(self, start=0):
+        ''' Yields (cIDX, samples) for every cIDX from start on that has samples. '''
+        for cidx in range(start, self.max_cidx + 1):
+            rows = self.second(cidx)
+            if len(rows):
+                yield cidx, rows
+
+    def sample(self, cidx, thread_id):
+        ''' The last sample of a thread in a cIDX, or None. '''
+        rows = self.second(cidx)
+        i = np.searchsorted(rows['thread_id'], thread_id, side="right") - 1
+        if i < 0 or rows['thread_id'][i] != thread_id:
+            return None
+        return rows[i]
+
+
+def wire_records(rows):
+    ''' The RECORD fields of store rows, as a view that protocol.pack and Ingestor.apply accept. '''
+    return rows[list(protocol.RECORD.names)]
+
+
+# Converters
+############################################################################
+def _write(records, index, path):
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, INDEX_FILE), index)
+    if not isinstance(records, np.memmap):
+        np.save(os.path.join(path, RECORDS_FILE), records)
+
+
+def _build_index(cidx):
+    max_cidx = int(cidx[-1]) if len(cidx) else -1
+    return np.searchsorted(cidx, np.arange(max_cidx + 2), side="left").astype(np.int64)
+
+
+def convert_csv(csv_path, store_path, chunk_bytes=csvreader.CHUNK_BYTES):
+    ''' Converts the single instrumentation CSV into a store, parsing it a block at a time and
+        writing the rows straight into the mapped output, so the CSV is never held in memory.
+    '''
+    count = csvreader.count_rows(csv_path)
+    os.makedirs(store_path, exist_ok=True)
+    records_path = os.path.join(store_path, RECORDS_FILE)
+    records = np.lib.format.open_memmap(records_path, mode="w+", dtype=RUN_RECORD, shape=(count,))
+    filled = 0
+    for chunk in csvreader.read_chunks(csv_path, chunk_bytes):
+        records[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+        print(str(filled) + " of " + str(count) + " rows converted")
+
+    ## The CSV is written one cIDX after the other, sort only if threads within a cIDX are out of order
+    order = np.lexsort((records['thread_id'], records['cidx']))
+    if (order != np.arange(count)).any():
+        sorted_path = records_path + ".sorting"
+        out = np.lib.format.open_memmap(sorted_path, mode="w+", dtype=RUN_RECORD, shape=(count,))
+        step = max(1, chunk_bytes // RUN_RECORD.itemsize)
+        for start in range(0, count, step):
+            out[start:start + step] = records[order[start:start + step]]
+        out.flush()
+        del records, out
+        shutil.move(sorted_path, records_path)
+        records = np.load(records_path, mmap_mode="r")
+    else:
+        records.flush()
+    _write(records, _build_index(records['cidx']), store_path)
+    return RunStore(store_path)
+
+
+def convert_thread_files(directory, store_path):
+    ''' Converts a directory of instrumentation_thread_<id>.csv files into a store, writing the
+        merged slices straight into the mapped output. The merge yields cIDX in order and threads in
+        file name order, a file named after another thread than the one it holds is an error.
+    '''
+    count = sum(csvreader.count_rows(path) for path in csvreader.thread_files(directory))
+    os.makedirs(store_path, exist_ok=True)
+    records = np.lib.format.open_memmap(os.path.join(store_path, RECORDS_FILE), mode="w+",
+                                        dtype=RUN_RECORD, shape=(count,))
+    filled = 0
+    last_cidx = -1
+    for rows in csvreader.merge_thread_files(directory):
+        cidx = int(rows['cidx'][0])
+        threads = rows['thread_id']
+        if cidx <= last_cidx or (threads[1:] < threads[:-1]).any():
+            raise ValueError("cIDX " + str(cidx) + " of " + directory + " isn't in (cIDX, ThreadID) order, "
+                             "check that every file is named after the thread it holds")
+        records[filled:filled + len(rows)] = rows
+        filled += len(rows)
+        last_cidx = cidx
+    records.flush()
+    _write(records, _build_index(records['cidx']), store_path)
+    return RunStore(store_path)
+
+
+def convert(source, store_path):
+    ''' Converts a CSV file or a directory of per-thread CSV files. '''
+    if os.path.isdir(source):
+        return convert_thread_files(source, store_path)
+    return convert_csv(source, store_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts instrumentation CSV files into a run store")
+    parser.add_argument("source", help="instrumentation CSV file, or directory of per-thread CSV files")
+    parser.add_argument("store", help="directory the store is written to")
+    args = parser.parse_args()
+    store = convert(args.source, args.store)
+    print(str(len(store)) + " samples over " + str(store.max_cidx + 1) + " cIDX written to " + args.store)
+
+
+if __name__ == '__main__':
+    main()
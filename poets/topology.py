@@ -0,0 +1,69 @@
+''' Model of a POETS deployment. The hardware is organised as thread -> core -> mailbox -> board -> box,
+    and a deployment is made of one or more boxes. A Topology holds the size of every level, and
+    precomputes as NumPy arrays the index of the element containing each thread at every level, the
+    parent of every element, and the heatmap tile coordinates of every level, so that the dashboard
+    allocates only what the deployment needs.
+
+    A topology is loaded from a JSON file, every key being optional, e.g. a single box:
+        {"boxes": 1, "fpga_fields": [0, 1, 2, 3, 4, 5], "grid_widths": {"CORE": 24}}
+    "fpga_fields" fixes the board order of the address translation, see poets.addressing.
+'''
+import json
+import numpy as np
+from poets.addressing import BOARD_SHIFT
+
+# Topology Configurations
+############################################################################
+LEVELS = ["THREAD", "CORE", "MAILBOX", "BOARD", "BOX"]
+BOXES = 8
+BOARDS_PER_BOX = 6
+MAILBOXES_PER_BOARD = 16
+CORES_PER_MAILBOX = 4
+THREADS_PER_CORE = 16
+
+
+class Topology:
+
+    def __init__(self, boxes=BOXES, boards_per_box=BOARDS_PER_BOX, mailboxes_per_board=MAILBOXES_PER_BOARD,
+                 cores_per_mailbox=CORES_PER_MAILBOX, threads_per_core=THREADS_PER_CORE,
+                 grid_widths=None, fpga_fields=None):
+        if threads_per_core * cores_per_mailbox * mailboxes_per_board != 1 << BOARD_SHIFT:
+            raise ValueError("a board must hold " + str(1 << BOARD_SHIFT) + " threads to match the thread addresses")
+        self.fpga_fields = fpga_fields
+
+        ## Number of elements of each level contained in one element of the level above
+        self.fanout = {"CORE" : threads_per_core,
+                       "MAILBOX" : cores_per_mailbox,
+                       "BOARD" : mailboxes_per_board,
+                       "BOX" : boards_per_box}
+        self.sizes = {"THREAD" : 1}         ## Number of threads contained in one element of each level
+        for lower, upper in zip(LEVELS, LEVELS[1:]):
+            self.sizes[upper] = self.sizes[lower] * self.fanout[upper]
+        self.thread_count = boxes * self.sizes["BOX"]
+        self.counts = {level : self.thread_count // size for level, size in self.sizes.items()}
+
+        ## thread_index[level][t] is the element of level containing thread t,
+        ## parent[level][e] is the element of the level above containing element e of level
+        threads = np.arange(self.thread_count, dtype=np.int32)
+        self.thread_index = {level : threads // size for level, size in self.sizes.items()}
+        self.parent = {lower : np.arange(self.counts[lower], dtype=np.int32) // self.fanout[upper]
+                       for lower, upper in zip(LEVELS, LEVELS[1:])}
+
+        ## Heatmap tiles laid out in rows of grid_widths[level], two units high
+        self.grid_widths = {level : self.default_width(count) for level, count in self.counts.items()}
+        self.grid_widths.update(grid_widths or {})
+        self.tiles = {}
+        for level, count in self.counts.items():
+            tiles = np.arange(count)
+            self.tiles[level] = (tiles % self.grid_widths[level], tiles // self.grid_widths[level] * 2)
+
+    @staticmethod
+    def default_width(count):
+        ''' Tiles per row giving about three columns for every four rows, 48 columns for 3072 cores. '''
+        return max(1, int(round(np.sqrt(count * 0.75))))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as topology_file:
+            config = json.load(topology_file)
+        return cls(**config)
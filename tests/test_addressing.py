@@ -0,0 +1,58 @@
+''' Translation of thread addresses into contiguous indices. '''
+import numpy as np
+import pytest
+from poets.addressing import BOARD_SHIFT, FIELD_BITS, INVALID, AddressTranslator
+
+
+def addresses(field, local):
+    return (field << BOARD_SHIFT) | local
+
+
+def test_boards_are_learnt_in_order_of_appearance():
+    translator = AddressTranslator()
+    indices = translator.translate_many([addresses(9, 3), addresses(5, 1), addresses(9, 4), addresses(0, 7)])
+    np.testing.assert_array_equal(indices, [addresses(1, 3), addresses(2, 1), addresses(1, 4), 7])
+
+
+def test_out_of_range_fields_are_invalid():
+    translator = AddressTranslator()
+    indices = translator.translate_many([addresses(1 << FIELD_BITS, 0), addresses(3, 2)])
+    assert indices[0] == INVALID
+    assert indices[1] == addresses(1, 2)
+
+
+def test_boards_missing_from_a_fixed_mapping_are_invalid():
+    translator = AddressTranslator([0, 8, 9])
+    indices = translator.translate_many([addresses(9, 5), addresses(4, 5)])
+    np.testing.assert_array_equal(indices, [addresses(2, 5), INVALID])
+
+
+def test_learning_stops_at_max_boards():
+    translator = AddressTranslator(max_boards=2)
+    indices = translator.translate_many([addresses(3, 0), addresses(4, 0)])
+    np.testing.assert_array_equal(indices, [addresses(1, 0), INVALID])
+
+
+def test_invalid_fixed_mappings_are_rejected():
+    with pytest.raises(ValueError):
+        AddressTranslator([0, 1 << FIELD_BITS])
+    with pytest.raises(ValueError):
+        AddressTranslator(list(range(4)), max_boards=3)
+
+
+def test_shared_table_numbers_boards_once():
+    table = np.full(1 << FIELD_BITS, INVALID, dtype=np.int64)
+    first, second = AddressTranslator(table=table), AddressTranslator(table=table)
+    first.translate_many([addresses(7, 0)])
+    np.testing.assert_array_equal(second.translate_many([addresses(5, 0), addresses(7, 0)]),
+                                  [addresses(2, 0), addresses(1, 0)])
+
+
+def test_boards_over_max_boards_are_reported_once_and_counted(capsys):
+    translator = AddressTranslator(max_boards=2)
+    translator.translate_many([addresses(3, 0), addresses(4, 0), addresses(4, 1)])
+    translator.translate_many([addresses(4, 2), addresses(5, 0)])
+    assert translator.ignored == {4 : 3, 5 : 1}
+    assert capsys.readouterr().out.count("ignored") == 2
+    translator.reset()
+    assert translator.ignored == {}
@@ -0,0 +1,35 @@
+''' The partial recomputation of the aggregator against a full reduction of every level. '''
+import numpy as np
+from poets.aggregation import HierarchyAggregator
+from poets.topology import LEVELS, Topology
+
+
+def full_levels(topology, thread_level):
+    return {level : thread_level.astype(np.int64).reshape(-1, size).sum(axis=1) // size
+            for level, size in topology.sizes.items()}
+
+
+def test_update_cores_matches_full_reduction():
+    topology = Topology(boxes=2)
+    aggregator = HierarchyAggregator(topology)
+    rng = np.random.default_rng(0)
+    thread_level = np.zeros(topology.thread_count, dtype=np.uint16)
+    biggest = topology.thread_count - 1
+    for _ in range(5):
+        cores = rng.choice(topology.counts["CORE"], 40, replace=False)
+        threads = (cores[:, None] * topology.sizes["CORE"] + np.arange(topology.sizes["CORE"])).ravel()
+        thread_level[threads] = rng.integers(0, 5000, len(threads))
+        levels, touched = aggregator.update_cores(thread_level, biggest, cores)
+        expected = full_levels(topology, thread_level)
+        for level in LEVELS:
+            np.testing.assert_array_equal(levels[level], expected[level])
+        np.testing.assert_array_equal(touched["CORE"], np.unique(cores))
+
+
+def test_levels_stop_at_the_biggest_thread():
+    topology = Topology(boxes=1)
+    aggregator = HierarchyAggregator(topology)
+    thread_level = np.zeros(topology.thread_count, dtype=np.uint16)
+    levels, _ = aggregator.update_cores(thread_level, topology.sizes["BOARD"], [0])
+    assert len(levels["BOARD"]) == 2
+    assert len(levels["BOX"]) == 1
@@ -0,0 +1,74 @@
+''' Policies and drop accounting of the frame channel. '''
+import numpy as np
+import pytest
+from poets.channel import SnapshotChannel
+from poets.live import LiveState
+from poets.topology import Topology
+
+
+def put_frames(channel, count):
+    for i in range(count):
+        channel.put({"a" : np.full(3, i), "b" : np.arange(i)})
+
+
+def numbers(frames):
+    return [int(frame["a"][0]) for frame in frames]
+
+
+def test_latest_coalesces_into_one_frame():
+    channel = SnapshotChannel({"a" : 3, "b" : 10}, capacity=8, policy="latest")
+    put_frames(channel, 5)
+    assert channel.depth == 1
+    frames = channel.take()
+    assert numbers(frames) == [4]
+    np.testing.assert_array_equal(frames[0]["b"], np.arange(4))
+    assert channel.stats()["dropped"] == 4
+    assert channel.take() == []
+
+
+def test_oldest_drops_the_oldest_when_full():
+    channel = SnapshotChannel({"a" : 3, "b" : 10}, capacity=3, policy="oldest")
+    put_frames(channel, 5)
+    assert [numbers(channel.take()) for _ in range(4)] == [[2], [3], [4], []]
+    stats = channel.stats()
+    assert (stats["put"], stats["dropped"], stats["max_depth"], stats["depth"]) == (5, 2, 3, 0)
+
+
+def test_keep_returns_every_pending_frame():
+    channel = SnapshotChannel({"a" : 3, "b" : 10}, capacity=3, policy="keep")
+    put_frames(channel, 2)
+    assert numbers(channel.take()) == [0, 1]
+    put_frames(channel, 4)
+    frames = channel.take()
+    assert numbers(frames) == [1, 2, 3]         ## frame 0 of the second batch dropped
+    assert channel.stats()["dropped"] == 1
+    np.testing.assert_array_equal(frames[-1]["b"], np.arange(3))
+
+
+def test_taken_frames_hold_the_keys_put_only():
+    channel = SnapshotChannel({"a" : 3, "n" : 1}, {"a" : np.uint16, "n" : np.int64}, capacity=2, policy="keep")
+    channel.put({"a" : np.arange(3), "n" : (1 << 40,)})
+    channel.put({"n" : (7,)})
+    first, second = channel.take()
+    assert first["a"].dtype == np.uint16 and first["n"][0] == 1 << 40
+    assert list(second) == ["n"]
+
+
+def test_unknown_policy_is_an_error():
+    with pytest.raises(ValueError):
+        SnapshotChannel({"a" : 1}, policy="newest")
+
+
+def test_sessions_receive_the_level_they_show():
+    state = LiveState(Topology(boxes=1), mode="external", refresh=None, frame_policy="keep")
+    frames = state.subscribe("session", level="BOARD")
+    frame = {level : np.full(count, 3, dtype=np.uint16) for level, count in state.topology.counts.items()}
+    state.publish(frame)
+    state.show("session", "THREAD")
+    state.publish(frame)
+    empty, board, thread = frames.take()
+    assert sorted(empty) == ["BOARD", "frame"] and len(empty["BOARD"]) == 0
+    assert sorted(board) == ["BOARD", "frame"] and len(board["BOARD"]) == state.topology.counts["BOARD"]
+    assert sorted(thread) == ["THREAD", "frame"]
+    assert [int(f["frame"][0]) for f in (empty, board, thread)] == [state.frame_number - 3 + i for i in range(3)]
+    state.stop()
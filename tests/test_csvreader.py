@@ -0,0 +1,48 @@
+''' Reading of instrumentation CSV files. '''
+import numpy as np
+from poets import csvreader
+
+HEADER = "ThreadID,cIDX,Time," + ",".join("c" + str(i) for i in range(3, 19)) + "\n"
+
+
+def line(thread, cidx, tx):
+    values = [0] * 19
+    values[0], values[1], values[2], values[18] = thread, cidx, cidx * 0.5, tx
+    return ",".join(str(value) for value in values) + "\n"
+
+
+def test_merge_keeps_cidx_then_thread_order(tmp_path):
+    ## files starting and ending on different seconds, with gaps
+    seconds = {0 : [0, 1, 2, 3], 1 : [1, 3], 2 : [0, 2, 3, 4], 10 : [4]}
+    for thread, cidxs in seconds.items():
+        text = HEADER + "".join(line(thread, cidx, thread * 100 + cidx) for cidx in cidxs)
+        (tmp_path / ("instrumentation_thread_" + str(thread) + ".csv")).write_text(text)
+
+    slices = list(csvreader.merge_thread_files(str(tmp_path), workers=2))
+    assert [int(s['cidx'][0]) for s in slices] == [0, 1, 2, 3, 4]
+    for s in slices:
+        assert (s['cidx'] == s['cidx'][0]).all()
+        expected = [thread for thread, cidxs in seconds.items() if s['cidx'][0] in cidxs]
+        np.testing.assert_array_equal(s['thread_id'], expected)
+        np.testing.assert_array_equal(s['tx_per_s'], s['thread_id'] * 100 + s['cidx'])
+
+
+def test_stream_slices_cut_on_cidx_changes(tmp_path):
+    path = tmp_path / "instrumentation.csv"
+    path.write_text(HEADER + "".join(line(thread, cidx, 1) for cidx in range(6) for thread in range(50)))
+    slices = list(csvreader.stream_slices(str(path), chunk_bytes=512))     ## chunks end mid-slice
+    assert [len(s) for s in slices] == [50] * 6
+    assert [int(s['cidx'][0]) for s in slices] == list(range(6))
+
+
+def test_merge_reads_ahead_with_few_open_files(tmp_path):
+    ## blocks end mid-line and only two files stay open, so cursors are refilled and reopened
+    for thread in range(5):
+        text = HEADER + "".join(line(thread, cidx, thread * 100 + cidx) for cidx in range(thread, 40))
+        (tmp_path / ("instrumentation_thread_" + str(thread) + ".csv")).write_text(text)
+
+    slices = list(csvreader.merge_thread_files(str(tmp_path), workers=2, read_ahead=100, open_files=2))
+    assert [int(s['cidx'][0]) for s in slices] == list(range(40))
+    for s in slices:
+        np.testing.assert_array_equal(s['thread_id'], np.arange(min(int(s['cidx'][0]) + 1, 5)))
+        np.testing.assert_array_equal(s['tx_per_s'], s['thread_id'] * 100 + s['cidx'])
@@ -0,0 +1,48 @@
+''' Change tracking and second slots of the ingest buffers. '''
+import numpy as np
+from poets import protocol
+from poets.ingest import SLOTS, IngestBuffers, Ingestor, METRICS
+
+HIT = METRICS.index("cache_hit")
+
+
+def write(buffers, ingestor, threads, cidx):
+    records = np.zeros(len(threads), dtype=protocol.RECORD)
+    records['thread_id'] = threads
+    records['cidx'] = cidx
+    records['tx_per_s'] = 100
+    records['cache_hit'] = cidx + 1
+    with buffers.writing():
+        ingestor.apply(records)
+
+
+def test_dirty_cores_are_the_cores_written_since_the_stamp():
+    buffers = IngestBuffers(2048, 128)
+    ingestor = Ingestor(buffers)
+    write(buffers, ingestor, [0, 1, 17], 0)
+    view = buffers.snapshot()
+    np.testing.assert_array_equal(view.dirty_cores(0), [0, 1])
+    seen = view.batches
+
+    write(buffers, ingestor, [33, 34], 0)
+    write(buffers, ingestor, [80], 1)
+    view = buffers.snapshot()
+    np.testing.assert_array_equal(view.dirty_cores(seen), [2, 5])
+    assert len(view.dirty_cores(view.batches)) == 0
+    assert len(buffers.snapshot().dirty_cores(view.batches)) == 0     ## reading doesn't stamp anything
+
+
+def test_wrapped_slot_holds_the_new_second():
+    buffers = IngestBuffers(2048, 128)
+    ingestor = Ingestor(buffers)
+    for cidx in range(SLOTS + 1):
+        write(buffers, ingestor, [0], cidx)
+    assert buffers.second(0) is None            ## its slot now holds second SLOTS
+    assert buffers.second(SLOTS)[0, HIT] == SLOTS + 1
+
+    write(buffers, ingestor, [0], 0)            ## too late for its slot
+    assert buffers.second(SLOTS)[0, HIT] == SLOTS + 1
+    view = IngestBuffers(2048, 128)
+    buffers.copy_to(view, SLOTS)                ## the wrapped slot is copied as the second it holds
+    np.testing.assert_array_equal(view.second(SLOTS), buffers.second(SLOTS))
+    assert view.second(SLOTS - 1)[0, HIT] == 0  ## slots before since aren't copied
@@ -0,0 +1,69 @@
+''' LiveState.update on ingest buffers written directly, without a socket. '''
+import numpy as np
+from poets.bench import synthetic_run
+from poets.ingest import Ingestor, finish_run
+from poets.live import H_IDLE, LiveState
+from poets.topology import Topology
+
+
+def live_state(tmp_path):
+    state = LiveState(Topology(boxes=1), mode="external", refresh=None, archive=str(tmp_path / "archive"))
+    return state, Ingestor(state.buffers, state.topology.fpga_fields)
+
+
+def feed(state, ingestor, seconds, skip=(), seed=0):
+    for cidx, records in synthetic_run(state.thread_count, seconds, seed):
+        if cidx not in skip:
+            with state.buffers.writing():
+                ingestor.apply(records)
+
+
+def drain(state):
+    while state.update():
+        pass
+
+
+def test_looped_run_finishing_between_updates(tmp_path):
+    state, ingestor = live_state(tmp_path)
+    feed(state, ingestor, 10)
+    state.update()                      ## run 1 in progress
+    finish_run(state.buffers)
+    feed(state, ingestor, 12, seed=1)   ## run 2 started before the next update
+    assert state.update() is False      ## run 1 is in the table, run 2 isn't over
+    assert state.execution[0] == 9
+    assert [run["seconds"] for run in state.archived_runs()] == [9]
+    assert len(state.whole_history()['x']) == 11    ## run 2's history, up to its last complete second
+
+    finish_run(state.buffers)
+    drain(state)
+    assert list(state.execution[:2]) == [11, 9]
+    assert len(state.whole_history()['x']) == 12
+    state.stop()
+
+
+def test_skipped_seconds_are_gaps(tmp_path):
+    state, ingestor = live_state(tmp_path)
+    feed(state, ingestor, 8, skip=(3, 4))
+    finish_run(state.buffers)
+    drain(state)
+    idle = state.whole_history()['mean'][:, H_IDLE]
+    np.testing.assert_array_equal(np.flatnonzero(np.isnan(idle)), [3, 4])
+    totals = state.core_history(np.arange(state.core_count))
+    np.testing.assert_array_equal(np.flatnonzero(np.isnan(totals).any(axis=1)), [3, 4])
+    state.stop()
+
+
+def test_new_run_before_the_previous_one_was_seen(tmp_path):
+    state, ingestor = live_state(tmp_path)
+    feed(state, ingestor, 10)
+    finish_run(state.buffers)
+    feed(state, ingestor, 6, seed=1)    ## run 1 ended and run 2 started before any update
+    assert state.update() is False      ## run 2 is in progress, not finished in run 1's place
+    assert state.table_version == 0
+    assert len(state.whole_history()['x']) == 5     ## the last second of run 2 isn't complete yet
+
+    finish_run(state.buffers)
+    drain(state)
+    assert state.execution[0] == 5
+    assert [run["seconds"] for run in state.archived_runs()] == [5]
+    state.stop()
@@ -0,0 +1,39 @@
+''' Round trips of the wire formats. '''
+import numpy as np
+import pytest
+from poets import protocol
+
+
+def records(count):
+    rng = np.random.default_rng(0)
+    out = np.zeros(count, dtype=protocol.RECORD)
+    for name in protocol.RECORD.names:
+        out[name] = rng.integers(0, 1 << 20, count)
+    return out
+
+
+def test_binary_round_trip():
+    sent = records(1000)
+    datagrams = list(protocol.pack(sent))
+    assert all(len(datagram) <= protocol.MTU_PAYLOAD for datagram in datagrams)
+    assert len(datagrams) == -(-len(sent) // protocol.records_per_datagram())
+    received = np.concatenate([protocol.decode(datagram) for datagram in datagrams])
+    np.testing.assert_array_equal(received, sent)
+
+
+def test_text_round_trip():
+    sent = records(1)
+    np.testing.assert_array_equal(protocol.decode(protocol.encode_text(sent[0])), sent)
+
+
+def test_truncated_datagram_is_rejected():
+    datagram = protocol.encode_binary(records(3))
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode(datagram[:-1])
+
+
+def test_unknown_version_is_rejected():
+    datagram = bytearray(protocol.encode_binary(records(1)))
+    datagram[len(protocol.MAGIC)] = max(protocol.SUPPORTED_VERSIONS) + 1
+    with pytest.raises(protocol.ProtocolError):
+        protocol.decode(bytes(datagram))
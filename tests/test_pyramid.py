@@ -0,0 +1,32 @@
+''' Buckets of the time pyramid. '''
+import numpy as np
+from poets.pyramid import TimePyramid
+
+
+def test_buckets_hold_min_max_and_mean():
+    pyramid = TimePyramid(1, factors=(1, 10))
+    for second in range(25):
+        pyramid.append(second, [second])
+    coarse = pyramid.series(1)
+    np.testing.assert_array_equal(coarse['x'], [4.5, 14.5, 24.5])
+    np.testing.assert_array_equal(coarse['low'][:, 0], [0, 10, 20])
+    np.testing.assert_array_equal(coarse['high'][:, 0], [9, 19, 24])
+    np.testing.assert_array_equal(coarse['mean'][:, 0], [4.5, 14.5, 22])
+    assert len(pyramid.series(0)['x']) == 25
+
+
+def test_missing_seconds_leave_empty_buckets():
+    pyramid = TimePyramid(1, factors=(1, 10))
+    pyramid.append(0, [1])
+    pyramid.append(15, [np.nan])
+    pyramid.append(25, [3])
+    coarse = pyramid.series(1)
+    assert np.isnan(coarse['mean'][1, 0]) and np.isnan(coarse['low'][1, 0])
+    np.testing.assert_array_equal(coarse['mean'][[0, 2], 0], [1, 3])
+
+
+def test_level_for_bounds_the_points():
+    pyramid = TimePyramid(1, factors=(1, 10, 60))
+    assert pyramid.level_for(400, max_points=500) == 0
+    assert pyramid.level_for(4000, max_points=500) == 1
+    assert pyramid.level_for(10 ** 6, max_points=500) == 2
@@ -0,0 +1,36 @@
+''' Conversion of per-thread CSV files into a run store. '''
+import numpy as np
+import pytest
+from poets import runstore
+
+HEADER = "ThreadID,cIDX,Time," + ",".join("c" + str(i) for i in range(3, 19)) + "\n"
+
+
+def write_thread(directory, name, thread, cidxs):
+    rows = []
+    for cidx in cidxs:
+        values = [0] * 19
+        values[0], values[1], values[2] = thread, cidx, cidx * 0.5
+        rows.append(",".join(str(value) for value in values) + "\n")
+    (directory / ("instrumentation_thread_" + str(name) + ".csv")).write_text(HEADER + "".join(rows))
+
+
+def test_thread_files_stream_into_store(tmp_path):
+    source = tmp_path / "threads"
+    source.mkdir()
+    for thread in range(4):
+        write_thread(source, thread, thread, range(thread, 6))
+    store = runstore.convert_thread_files(str(source), str(tmp_path / "store"))
+    assert len(store) == sum(6 - thread for thread in range(4))
+    assert store.max_cidx == 5
+    for cidx in range(6):
+        np.testing.assert_array_equal(store.second(cidx)['thread_id'], np.arange(min(cidx + 1, 4)))
+
+
+def test_misnamed_thread_file_is_an_error(tmp_path):
+    source = tmp_path / "threads"
+    source.mkdir()
+    write_thread(source, 0, 1, range(3))        ## holds thread 1 but sorts before thread 0
+    write_thread(source, 1, 0, range(3))
+    with pytest.raises(ValueError):
+        runstore.convert_thread_files(str(source), str(tmp_path / "store"))